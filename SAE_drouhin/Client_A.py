@@ -1,12 +1,13 @@
-
-import socket
 import threading
 from PyQt5 import QtWidgets, QtCore
-from datetime import datetime
+
+from log_view import LogView
+from onion.client import ClientNode
+from onion.logbuf import Logger
 
 
 class ClientA(QtWidgets.QWidget):
-    message_signal = QtCore.pyqtSignal(str)
+    """Fenêtre du client : vue sur ClientNode (onion.client)."""
     status_signal = QtCore.pyqtSignal(str)
 
     def __init__(self):
@@ -14,8 +15,8 @@ class ClientA(QtWidgets.QWidget):
         self.setWindowTitle("Client A")
         self.resize(500, 600)
 
-        self.chat = QtWidgets.QTextEdit()
-        self.chat.setReadOnly(True)
+        self.logger = Logger()
+        self.chat = LogView(self.logger)
         self.master_label = QtWidgets.QLabel("Master:")
         self.master_input = QtWidgets.QLineEdit("127.0.0.1:9000")
         self.path_label = QtWidgets.QLabel("Chemin:")
@@ -24,6 +25,8 @@ class ClientA(QtWidgets.QWidget):
         self.msg_input.returnPressed.connect(lambda: self.send_message())
         self.send_btn = QtWidgets.QPushButton("Onion")
         self.send_btn.clicked.connect(lambda: self.send_message())
+        self.file_btn = QtWidgets.QPushButton("Envoyer un fichier")
+        self.file_btn.clicked.connect(self.send_file)
         self.status = QtWidgets.QLabel("Déconnecté")
         self.dest_label = QtWidgets.QLabel("Destination (nom client) :")
         self.dest_input = QtWidgets.QLineEdit("Client_B")
@@ -41,15 +44,14 @@ class ClientA(QtWidgets.QWidget):
         layout.addWidget(self.dest_input)
         layout.addWidget(self.msg_input)
         layout.addWidget(self.send_btn)
+        layout.addWidget(self.file_btn)
         layout.addWidget(self.connect_btn)
         layout.addWidget(self.status)
         self.setLayout(layout)
 
-        self.message_signal.connect(self.log)
         self.status_signal.connect(self.set_status)
 
-        self.sock = None
-        self.router_pub_keys = {}
+        self.node = None
         self.connect_thread = None
 
     def start_connect(self):
@@ -59,115 +61,53 @@ class ClientA(QtWidgets.QWidget):
             return
 
         self.status_signal.emit("Connexion au Master...")
-        self.connect_thread = threading.Thread(target=self.connect_loop, daemon=True)
+        self.node = ClientNode(self.client_name, self.master_input.text().strip(), observer=self, logger=self.logger)
+        self.connect_thread = threading.Thread(target=self.node.connect_loop, daemon=True)
         self.connect_thread.start()
 
-    def log(self, msg):
-        self.chat.append(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
-
-    def set_status(self, text):
-        self.status.setText(text)
-
-    def simple_encrypt(self, msg, key):
-        """XOR symétrique (même clé chiffrement/déchiffrement)"""
-        return ''.join(chr(ord(c) ^ (key & 0xFF)) for c in msg)
-
-    def parse_keys(self, keys_data):
-        self.router_pub_keys = {}
-        for info in keys_data.split("|"):
-            name, key = info.split(":")
-            self.router_pub_keys[name] = int(key)
-        self.log(f"Clés: {list(self.router_pub_keys.values())}")
-
-    def build_onion(self, path, dest, message):
-
-        hops = [h.strip() for h in path.split(",") if h.strip()]
-        inner = f"TO:{dest};MSG:{message}"  # ce que voit le dernier routeur
-        current = inner
-
-
-        for i, router in enumerate(reversed(hops)):
-            key = self.router_pub_keys[router]  # même valeur que côté routeur
-
-
-            if i == 0:
-
-                next_hop = ""  #vide, signifiera "plus de routeur"
-            else:
-                # pour R2, R1, etc.
-                next_hop = hops[len(hops) - i]
-
+    # --- Observateur appelé par ClientNode (depuis son thread) ---
+    def status_changed(self, text):
+        self.status_signal.emit(text)
 
-            layer = f"NEXT:{next_hop}|{current}"
+    def message_received(self, sender, text):
+        # L'anneau du Logger est sûr entre threads, LogView l'affiche au prochain tick
+        self.logger.log(f"{sender}: {text}", category="chat")
 
-            current = self.simple_encrypt(layer, key)
+    def file_received(self, sender, path, size):
+        self.logger.log(f"{sender}: fichier reçu {path} ({size} o)", category="chat")
 
-
-        return current
-
-    def connect_loop(self):
-        while True:
-            master_addr = self.master_input.text().strip()
-            if ":" not in master_addr:
-                self.status_signal.emit("Format Master invalide (ex: 127.0.0.1:9000)")
-                return
-
-            host, port = master_addr.split(":", 1)
-            try:
-                port = int(port)
-            except ValueError:
-                self.status_signal.emit("Port Master invalide")
-                return
-
-            try:
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.sock.connect((host, port))
-                self.sock.send(f"HELLO:{self.client_name}".encode())  # écrire "Client_A" ou "Client_B" dans l'interface graphique
-
-                data = self.sock.recv(4096).decode()
-                if data.startswith("KEYS:"):
-                    keys_str = data.split(":", 1)[1]
-                    self.parse_keys(keys_str)
-                    self.status_signal.emit(f"Connecté à {master_addr}")
-                    self.listen_loop()
-                    return
-                else:
-                    self.status_signal.emit("Réponse Master inattendue")
-                    return
-
-            except Exception as e:
-                self.status_signal.emit(f"Connexion échouée: {e}")
-                return
-
-    def listen_loop(self):
-        try:
-            while True:
-                data = self.sock.recv(4096)
-                if not data: break
-                msg = data.decode()
-                if msg.startswith("FROM:"):
-                    sender = msg.split(";")[0][5:]
-                    content = msg.split(";MSG:")[1]
-                    self.log(f"{sender}: {content}")
-        except Exception as e:
-            self.log(f"{e}")
+    def set_status(self, text):
+        self.status.setText(text)
 
     def send_message(self):
         msg = self.msg_input.text().strip()
-        if not msg or not self.sock:
+        if not msg or not self.node:
             return
 
         path = self.path_input.text().strip()  # exemple : "R1,R2,R3"
-        dest = self.dest_input.text().strip()  # exemple : "Client_B" ou "Client_A"
+        dest = self.dest_input.text().strip()  # exemple : "Client_B"
+
+        if self.node.send_message(path, dest, msg):
+            self.logger.log(f"Onion [{path}] → {dest}: {msg[:30]}...", category="chat")
+            self.msg_input.clear()
 
-        onion = self.build_onion(path, dest, msg)
-        if onion is None:
+    def send_file(self):
+        if not self.node:
             return
+        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Fichier à envoyer")
+        if not file_path:
+            return
+        path = self.path_input.text().strip()
+        dest = self.dest_input.text().strip()
+        # Envoi par morceaux, bloquant tant que le destinataire ne rend pas de crédit
+        threading.Thread(target=self.send_file_thread, args=(path, dest, file_path), daemon=True).start()
 
-        relay_msg = f"ONION:{onion}"
-        self.sock.send(relay_msg.encode('utf-8'))
-        self.log(f"Onion [{path}] → {dest}: {msg[:30]}...")
-        self.msg_input.clear()
+    def send_file_thread(self, path, dest, file_path):
+        try:
+            self.node.send_file(path, dest, file_path)
+            self.logger.log(f"Fichier [{path}] → {dest}: {file_path}", category="chat")
+        except Exception as e:
+            self.status_signal.emit(f"Envoi du fichier échoué: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,36 @@
+from PyQt5 import QtWidgets, QtCore
+
+from onion.logbuf import format_entry
+
+
+class LogView(QtWidgets.QPlainTextEdit):
+    """Zone de log plafonnée, alimentée par lots depuis l'anneau d'un Logger.
+
+    Un QTimer (thread Qt) vide l'anneau toutes les interval_ms et ajoute tout
+    le lot en un seul appendPlainText : un seul repaint par lot, et Qt n'est
+    jamais appelé depuis les threads réseau. setMaximumBlockCount borne la
+    mémoire : les lignes les plus anciennes disparaissent.
+    """
+
+    def __init__(self, logger=None, max_lines=5000, interval_ms=100, batch_limit=2000):
+        super().__init__()
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.batch_limit = batch_limit
+        self.logger = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+        if logger is not None:
+            self.attach(logger)
+
+    def attach(self, logger):
+        self.logger = logger
+        self.timer.start()
+
+    def flush(self):
+        if self.logger is None:
+            return
+        batch = self.logger.ring.drain(self.batch_limit)
+        if batch:
+            self.appendPlainText("\n".join(format_entry(e) for e in batch))
@@ -0,0 +1 @@
+"""Briques communes au Master, aux routeurs et aux clients Onion."""
@@ -0,0 +1,451 @@
+"""Banc de charge de bout en bout.
+
+Démarre un Master et N routeurs (processus sans interface, comme
+`python -m onion master|router`) puis M clients synthétiques dans ce
+processus, et rejoue des mélanges de trafic :
+
+    python -m onion bench --routers 3 --clients 8 --sizes 64,4096 \\
+        --hops 1,3 --fan-in 1,4 --messages 2000 --out bench.json
+
+Chaque scénario (taille × longueur de chemin × fan-in) mesure les messages
+par seconde, la latence de bout en bout (p50/p99/p999) et le temps CPU de
+chaque nœud ; avec --compress, les octets économisés et le CPU passé à
+compresser. Les micro-mesures (chiffrement, construction d'onion,
+aiguillage du Master, compression) suivent les fonctions du chemin
+critique ; pour chaque suite de chiffrement disponible, le débit (Mo/s)
+et la latence d'un saut. --cipher choisit la suite du scénario de bout en
+bout. Le tout est écrit en JSON pour comparer deux versions.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+from onion import cipher, compress, framing, layer
+from onion.cli import add_cipher_options, add_compress_options
+from onion.client import ClientNode
+from onion.logbuf import Logger
+
+WINDOW = 32  # messages en vol par émetteur
+TIMEOUT = 5.0  # au-delà, un message est compté perdu
+WORDS = ("onion", "routeur", "circuit", "message", "master", "client", "couche", "cle", "chemin",
+         "relais", "trame", "saut", "sortie", "entree", "flux", "debit", "latence", "file")
+
+
+def filler(size, seed=0):
+    """Texte ASCII de size octets qui se compresse comme du texte (pas comme "xxxx...")."""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS) + rng.choice(("", "", "s", str(rng.randrange(1000))))
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_cpu(pid):
+    """Temps CPU (user + système, en s) d'un processus, None si inconnu."""
+    if pid == os.getpid():
+        t = os.times()
+        return t.user + t.system
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        try:
+            t = psutil.Process(pid).cpu_times()
+            return t.user + t.system
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def sum_children_cpu(pid):
+    """CPU cumulé des processus fils directs de pid (workers du Master)."""
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        try:
+            children = [c.pid for c in psutil.Process(pid).children()]
+        except psutil.Error:
+            return None
+        return sum(process_cpu(c) or 0.0 for c in children)
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return None
+    return sum(process_cpu(c) or 0.0 for c in children)
+
+
+def percentile(values, p):
+    """values triées ; p entre 0 et 1."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+
+class Probe:
+    """Observateur d'un client synthétique : mesure la latence des messages reçus."""
+
+    def __init__(self, bench):
+        self.bench = bench
+
+    def status_changed(self, text):
+        pass
+
+    def message_received(self, sender, text):
+        self.bench.received(text)
+
+
+class Bench:
+    def __init__(self, routers=3, clients=4, circuits=True, log_level="warning", workers=1, router_args=(),
+                 compression="none", compress_threshold=compress.THRESHOLD, cipher_suite=cipher.DEFAULT_SUITE):
+        self.workers = workers
+        self.cipher_suite = cipher_suite
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self.router_args = list(router_args)
+        self.nb_routers = routers
+        self.nb_clients = clients
+        self.circuits = circuits
+        self.log_level = log_level
+        self.port = free_port()
+        self.procs = {}  # nom du nœud → Popen
+        self.nodes = []
+        self.lock = threading.Lock()
+        self.inflight = {}  # (émetteur, n°) → instant d'envoi
+        self.windows = {}  # émetteur → sémaphore des messages en vol
+        self.latencies = []
+
+    def spawn(self, name, *args):
+        cmd = [sys.executable, "-m", "onion", *args, "--log-level", self.log_level]
+        self.procs[name] = subprocess.Popen(
+            cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    def start(self, timeout=10.0):
+        master = f"127.0.0.1:{self.port}"
+        self.spawn("master", "master", "--host", "127.0.0.1", "--port", str(self.port),
+                   "--workers", str(self.workers), "--cipher", self.cipher_suite)
+        self.wait_port(timeout)
+        self.routers = [f"R{i + 1}" for i in range(self.nb_routers)]
+        for name in self.routers:
+            self.spawn(name, "router", "--name", name, "--master", master, *self.router_args)
+
+        for i in range(self.nb_clients):
+            node = ClientNode(f"Client_bench{i}", master, Probe(self), Logger(),
+                              use_circuits=self.circuits, compression=self.compression,
+                              compress_threshold=self.compress_threshold)
+            frames = node.connect()
+            threading.Thread(target=node.listen_loop, args=(frames,), daemon=True).start()
+            self.nodes.append(node)
+
+        # Les clés arrivent au fil des HELLO des routeurs
+        deadline = time.monotonic() + timeout
+        while any(len(n.router_pub_keys) < self.nb_routers for n in self.nodes):
+            if time.monotonic() > deadline:
+                raise RuntimeError("les routeurs ne se sont pas tous annoncés")
+            time.sleep(0.05)
+        time.sleep(0.2)  # annuaire PEERS diffusé aux routeurs
+
+    def wait_port(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("le Master ne répond pas")
+                time.sleep(0.05)
+
+    def stop(self):
+        for node in self.nodes:
+            node.close()
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(2)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def cpu(self):
+        usage = {name: process_cpu(proc.pid) for name, proc in self.procs.items()}
+        if self.workers > 1:
+            # Les workers sont des processus fils du Master lancé ici
+            usage["master"] = sum_children_cpu(self.procs["master"].pid)
+        usage["clients"] = process_cpu(os.getpid())
+        return usage
+
+    def compressed(self):
+        """(octets avant, octets après, CPU en s) cumulés par les compresseurs des clients."""
+        totals = [0, 0, 0.0]
+        for node in self.nodes:
+            if node.compressor:
+                totals[0] += node.compressor.raw_bytes
+                totals[1] += node.compressor.sent_bytes
+                totals[2] += node.compressor.cpu_seconds
+        return totals
+
+    def received(self, text):
+        now = time.perf_counter()
+        sender, _, rest = text.partition(":")
+        seq = rest.partition("|")[0]
+        with self.lock:
+            sent = self.inflight.pop((sender, seq), None)
+            if sent is None:
+                return
+            self.latencies.append(now - sent)
+        self.windows[sender].release()
+
+    def sender_loop(self, node, tag, path, dest, count, size):
+        window = self.windows[tag]
+        text = filler(size, zlib.crc32(tag.encode()))  # hash() varie d'un lancement à l'autre
+        for seq in range(count):
+            if not window.acquire(timeout=TIMEOUT):
+                break  # fenêtre bloquée : messages perdus, on abandonne l'émetteur
+            head = f"{tag}:{seq}|"
+            with self.lock:
+                self.inflight[(tag, str(seq))] = time.perf_counter()
+            node.send_message(path, dest, head + text[:max(0, size - len(head))])
+
+    def scenario(self, size, hops, fan_in, messages):
+        """Un scénario : chaque destination reçoit de fan_in émetteurs."""
+        if hops > self.nb_routers:
+            raise ValueError(f"{hops} sauts pour {self.nb_routers} routeurs")
+        groups = max(1, self.nb_clients // (fan_in + 1))
+        pairs = []
+        for g in range(groups):
+            dest = self.nodes[g * (fan_in + 1)]
+            for k in range(1, fan_in + 1):
+                pairs.append((self.nodes[(g * (fan_in + 1) + k) % self.nb_clients], dest))
+        per_sender = max(1, messages // len(pairs))
+
+        self.inflight.clear()
+        self.latencies = []
+        threads = []
+        for i, (node, dest) in enumerate(pairs):
+            tag = f"s{i}"
+            self.windows[tag] = threading.Semaphore(WINDOW)
+            path = ",".join(self.routers[(i + h) % self.nb_routers] for h in range(hops))
+            threads.append(threading.Thread(
+                target=self.sender_loop, args=(node, tag, path, dest.name, per_sender, size),
+                daemon=True,
+            ))
+
+        cpu_before = self.cpu()
+        packed_before = self.compressed()
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # Attente des derniers messages en vol
+        deadline = time.monotonic() + TIMEOUT
+        while self.inflight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        cpu_after = self.cpu()
+        raw, wire, cpu = (after - before for after, before in zip(self.compressed(), packed_before))
+
+        sent = per_sender * len(pairs)
+        received = len(self.latencies)
+        lat = sorted(self.latencies)
+        return {
+            "size": size,
+            "hops": hops,
+            "fan_in": fan_in,
+            "senders": len(pairs),
+            "sent": sent,
+            "received": received,
+            "lost": sent - received,
+            "duration_s": elapsed,
+            "msgs_per_s": received / elapsed if elapsed else 0.0,
+            "mb_per_s": received * size / elapsed / 1e6 if elapsed else 0.0,
+            "latency_ms": {
+                "p50": ms(percentile(lat, 0.50)),
+                "p99": ms(percentile(lat, 0.99)),
+                "p999": ms(percentile(lat, 0.999)),
+                "max": ms(lat[-1] if lat else None),
+            },
+            "cpu_s": {
+                name: (cpu_after[name] - before if before is not None and cpu_after[name] is not None else None)
+                for name, before in cpu_before.items()
+            },
+            "compression": {
+                "codec": self.compression,
+                "raw_bytes": raw,
+                "wire_bytes": wire,
+                "saved_bytes": raw - wire,
+                "saved_ratio": (raw - wire) / raw if raw else 0.0,
+                "compress_cpu_s": cpu,
+            },
+        }
+
+
+def ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def timed(func, duration=0.2):
+    """Durée moyenne d'un appel (µs)."""
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < duration:
+        func()
+        count += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / count * 1e6
+
+
+class NullPeer:
+    """Pair factice pour mesurer l'aiguillage du Master sans réseau."""
+
+    queued_bytes = 0
+    closed = False
+
+    def send(self, ftype, payload=b""):
+        return True
+
+
+def micro(sizes=(64, 4096)):
+    """Micro-mesures des fonctions du chemin critique, sans réseau."""
+    from onion.master import AsyncMaster
+
+    keys = {"R1": (0, 11111), "R2": (0, 22222), "R3": (0, 33333)}
+    node = ClientNode("Client_bench", "127.0.0.1:0", Probe(None), Logger())
+    node.router_pub_keys = keys
+    master = AsyncMaster(logger=Logger())
+    master.clients["Client_B"] = NullPeer()
+    for name, key in keys.items():
+        master.registry.keys.put(name, key)
+        master.registry.connected(name, NullPeer())
+
+    results = {}
+    for size in sizes:
+        text = filler(size)
+        data = text.encode()
+        final = framing.FINAL + framing.name_header("Client_B") + data
+        onion = framing.name_header("R1") + data
+        text_layer = layer.pack_layer("R2", data, layer.V1)
+        binary_layer = layer.pack_layer("R2", data)
+        r = results[str(size)] = {
+            "decrypt_us": timed(lambda: cipher.decrypt(data, 12345)),
+            "build_onion_3_us": timed(lambda: node.build_onion(["R1", "R2", "R3"], "Client_B", text)),
+            "handle_message_hop_us": timed(lambda: master.handle_message("R3", framing.HOP, final)),
+            "handle_message_onion_us": timed(lambda: master.handle_message("Client_A", framing.ONION, onion)),
+            "unpack_layer_v1_us": timed(lambda: layer.unpack_layer(text_layer)),
+            "unpack_layer_v2_us": timed(lambda: layer.unpack_layer(binary_layer)),
+        }
+        for row in cipher.benchmark_suites((size,), duration=0.2):
+            name = row["suite"]
+            r[f"{name}_encrypt_mb_s"] = row["encrypt_mb_s"]
+            r[f"{name}_decrypt_mb_s"] = row["decrypt_mb_s"]
+            r[f"{name}_batch_mb_s"] = row["batch_mb_s"]
+            r[f"{name}_hop_us"] = row["hop_us"]
+        for codec in compress.available():
+            packer = compress.Compressor(codec, threshold=0)
+            packed = packer.pack(data)
+            r[f"{codec}_compress_us"] = timed(lambda: packer.compress(data))
+            r[f"{codec}_decompress_us"] = timed(lambda: compress.unpack(packed))
+            r[f"{codec}_ratio"] = len(packed) / len(data)
+    return results
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="onion-bench", description="Banc de charge Master + routeurs + clients")
+    parser.add_argument("--routers", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--sizes", type=int_list, default=[64, 4096], help="tailles de message (octets)")
+    parser.add_argument("--hops", type=int_list, default=[1, 3], help="longueurs de chemin")
+    parser.add_argument("--fan-in", type=int_list, default=[1], help="émetteurs par destination")
+    parser.add_argument("--messages", type=int, default=1000, help="messages par scénario")
+    parser.add_argument("--workers", type=int, default=1, help="workers du Master (SO_REUSEPORT)")
+    parser.add_argument("--router-args", default="",
+                        help='options passées aux routeurs, ex: "--process-workers 2 --unordered"')
+    parser.add_argument("--no-circuits", action="store_true")
+    parser.add_argument("--no-micro", action="store_true", help="sans les micro-mesures")
+    add_compress_options(parser)
+    add_cipher_options(parser)
+    parser.add_argument("--out", help="fichier JSON des résultats (stdout sinon)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "routers": args.routers, "clients": args.clients, "messages": args.messages,
+            "circuits": not args.no_circuits, "window": WINDOW, "workers": args.workers,
+            "router_args": args.router_args, "compress": args.compress,
+            "compress_threshold": args.compress_threshold, "cipher": args.cipher,
+        },
+        "env": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "scenarios": [],
+    }
+
+    bench = Bench(args.routers, args.clients, circuits=not args.no_circuits, workers=args.workers,
+                  router_args=shlex.split(args.router_args), compression=args.compress,
+                  compress_threshold=args.compress_threshold, cipher_suite=args.cipher)
+    try:
+        bench.start()
+        for size, hops, fan_in in itertools.product(args.sizes, args.hops, args.fan_in):
+            r = bench.scenario(size, hops, fan_in, args.messages)
+            report["scenarios"].append(r)
+            lat = r["latency_ms"]
+            print(f"{size:>7} o {hops} sauts fan-in {fan_in}: {r['msgs_per_s']:9.0f} msg/s  "
+                  f"p50 {lat['p50'] or 0:7.2f} ms  p99 {lat['p99'] or 0:7.2f} ms  "
+                  f"p999 {lat['p999'] or 0:7.2f} ms  perdus {r['lost']}  "
+                  f"compressés -{r['compression']['saved_ratio']:.0%}", file=sys.stderr)
+    finally:
+        bench.stop()
+
+    if not args.no_micro:
+        report["micro"] = micro(args.sizes)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Chiffrement des couches de l'onion sur des octets (bytes / bytearray / memoryview).
+
+XOR symétrique avec l'octet de poids faible de la clé : encrypt et decrypt
+sont la même opération, partagée par les clients et les routeurs. Au lieu
+d'une boucle Python caractère par caractère, on applique tout le tampon d'un
+coup avec bytes.translate et une table précalculée par valeur de clé.
+
+Suites de chiffrement (SUITES) : le Master impose la sienne (--cipher) et
+l'annonce dans PRIVKEY et KEYS ("...|+shake") ; clients et routeurs disent
+au HELLO celles qu'ils connaissent. Chaque suite chiffre une couche ou un
+lot de couches (encrypt_batch / decrypt_batch : un seul tirage de nonces,
+état de clé réutilisé) :
+
+- xor : la suite historique ci-dessus, sans surcoût ni vraie confidentialité ;
+- shake : flux de clé SHAKE-256 (hashlib) sur clé dérivée + nonce de 16 octets ;
+- chacha20, aesgcm : AEAD de la bibliothèque cryptography si elle est
+  installée (nonce de 12 octets, étiquette de 16) : une couche altérée est
+  refusée au lieu de donner du texte illisible.
+
+Les suites dérivent 32 octets de la clé du routeur (blake2b) : la clé
+elle-même et sa rotation par époques ne changent pas.
+
+Micro-benchmark : python -m onion.cipher (ou python -m onion cipher)
+"""
+import functools
+import hashlib
+import importlib.util
+import os
+import time
+
+# Une table de 256 octets par valeur de clé : TABLES[k][b] == b ^ k
+TABLES = [bytes(b ^ k for b in range(256)) for k in range(256)]
+
+
+def xor_translate(data, key):
+    """Méthode par défaut : une seule passe en C via bytes.translate."""
+    if not isinstance(data, (bytes, bytearray)):
+        data = bytes(data)
+    return data.translate(TABLES[key & 0xFF])
+
+
+def xor_int(data, key):
+    """Variante entier : XOR du tampon entier vu comme un grand entier."""
+    n = len(data)
+    mask = int.from_bytes(bytes((key & 0xFF,)) * n, "little")
+    return (int.from_bytes(data, "little") ^ mask).to_bytes(n, "little")
+
+
+def xor_numpy(data, key):
+    """Variante NumPy (si installé)."""
+    import numpy
+    arr = numpy.frombuffer(data, dtype=numpy.uint8)
+    return (arr ^ numpy.uint8(key & 0xFF)).tobytes()
+
+
+def xor_python(data, key):
+    """Ancienne boucle octet par octet, gardée comme référence du benchmark."""
+    k = key & 0xFF
+    return bytes(b ^ k for b in data)
+
+
+def encrypt(data, key):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return xor_translate(data, key)
+
+
+# XOR : déchiffrer = rechiffrer
+decrypt = encrypt
+
+
+def xor_bytes(data, stream):
+    """data XOR stream (même longueur), en une passe sur deux grands entiers."""
+    n = len(data)
+    return (int.from_bytes(data, "little") ^ int.from_bytes(stream, "little")).to_bytes(n, "little")
+
+
+@functools.lru_cache(maxsize=1024)
+def derive_key(suite, key):
+    """Clé de routeur (entier) → 32 octets propres à la suite."""
+    return hashlib.blake2b(str(key).encode(), digest_size=32, person=f"onion-{suite}".encode()).digest()
+
+
+def as_bytes(data):
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+
+class XorSuite:
+    name = "xor"
+    overhead = 0
+
+    def available(self):
+        return True
+
+    def encrypt(self, data, key):
+        return encrypt(data, key)
+
+    decrypt = encrypt
+
+    def encrypt_batch(self, items):
+        """[(données, clé)] → [chiffré], dans l'ordre."""
+        return [encrypt(data, key) for data, key in items]
+
+    decrypt_batch = encrypt_batch
+
+
+@functools.lru_cache(maxsize=1024)
+def shake_state(key):
+    """SHAKE-256 ayant déjà absorbé la clé dérivée : copié pour chaque couche."""
+    return hashlib.shake_256(derive_key("shake", key))
+
+
+class ShakeSuite:
+    name = "shake"
+    nonce_size = 16
+    overhead = nonce_size
+
+    def available(self):
+        return True
+
+    def encrypt(self, data, key):
+        return self.encrypt_batch(((data, key),))[0]
+
+    def decrypt(self, data, key):
+        return self.decrypt_batch(((data, key),))[0]
+
+    def encrypt_batch(self, items):
+        items = list(items)
+        nonces = os.urandom(self.nonce_size * len(items))
+        out = []
+        for i, (data, key) in enumerate(items):
+            data = as_bytes(data)
+            nonce = nonces[i * self.nonce_size:(i + 1) * self.nonce_size]
+            stream = shake_state(key).copy()
+            stream.update(nonce)
+            out.append(nonce + xor_bytes(data, stream.digest(len(data))))
+        return out
+
+    def decrypt_batch(self, items):
+        out = []
+        for data, key in items:
+            if len(data) < self.nonce_size:
+                raise ValueError("couche shake trop courte")
+            view = memoryview(data)
+            stream = shake_state(key).copy()
+            stream.update(view[:self.nonce_size])
+            body = view[self.nonce_size:]
+            out.append(xor_bytes(body, stream.digest(len(body))))
+        return out
+
+
+def aead_module():
+    """Module cryptography.hazmat.primitives.ciphers.aead s'il est installé, None sinon."""
+    try:
+        from cryptography.hazmat.primitives.ciphers import aead
+    except ImportError:
+        return None
+    return aead
+
+
+@functools.lru_cache(maxsize=1024)
+def aead_cipher(suite, algorithm, key):
+    return getattr(aead_module(), algorithm)(derive_key(suite, key))
+
+
+class AeadSuite:
+    nonce_size = 12
+    overhead = nonce_size + 16  # nonce + étiquette d'authentification
+
+    def __init__(self, name, algorithm):
+        self.name = name
+        self.algorithm = algorithm  # classe du module aead
+
+    def available(self):
+        return aead_module() is not None
+
+    def encrypt(self, data, key):
+        return self.encrypt_batch(((data, key),))[0]
+
+    def decrypt(self, data, key):
+        return self.decrypt_batch(((data, key),))[0]
+
+    def encrypt_batch(self, items):
+        items = list(items)
+        nonces = os.urandom(self.nonce_size * len(items))
+        out = []
+        for i, (data, key) in enumerate(items):
+            nonce = nonces[i * self.nonce_size:(i + 1) * self.nonce_size]
+            out.append(nonce + aead_cipher(self.name, self.algorithm, key).encrypt(nonce, bytes(as_bytes(data)), None))
+        return out
+
+    def decrypt_batch(self, items):
+        from cryptography.exceptions import InvalidTag
+        out = []
+        for data, key in items:
+            view = memoryview(data)
+            try:
+                out.append(aead_cipher(self.name, self.algorithm, key).decrypt(
+                    bytes(view[:self.nonce_size]), bytes(view[self.nonce_size:]), None))
+            except InvalidTag:
+                raise ValueError(f"couche {self.name} altérée ou chiffrée avec une autre clé") from None
+        return out
+
+
+# nom → suite, de la plus rapide à la plus sûre
+SUITES = {
+    "xor": XorSuite(),
+    "shake": ShakeSuite(),
+    "chacha20": AeadSuite("chacha20", "ChaCha20Poly1305"),
+    "aesgcm": AeadSuite("aesgcm", "AESGCM"),
+}
+DEFAULT_SUITE = "xor"
+
+
+def available_suites():
+    """Suites utilisables ici."""
+    return [name for name, s in SUITES.items() if s.available()]
+
+
+def suite(name):
+    """Suite name, ValueError si elle est inconnue ou indisponible ici."""
+    found = SUITES.get(name)
+    if found is None or not found.available():
+        raise ValueError(f"suite de chiffrement inconnue ou indisponible ici: {name}")
+    return found
+
+
+METHODS = {
+    "python": xor_python,
+    "translate": xor_translate,
+    "int": xor_int,
+}
+
+
+def available_methods():
+    """METHODS + numpy s'il est installé (sans l'importer : il est lent à charger)."""
+    methods = dict(METHODS)
+    if importlib.util.find_spec("numpy") is not None:
+        methods["numpy"] = xor_numpy
+    return methods
+
+
+def benchmark(sizes=(64, 4096, 1024 * 1024), duration=0.5, methods=None):
+    """Mesure le débit (Mo/s) de chaque méthode pour chaque taille de tampon.
+
+    Renvoie une liste de dicts {method, size, mb_s}.
+    """
+    results = []
+    for size in sizes:
+        data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+        expected = xor_translate(data, 0x5A)
+        for name, func in (methods or available_methods()).items():
+            assert func(data, 0x5A) == expected, name
+            count = 0
+            start = time.perf_counter()
+            elapsed = 0.0
+            while elapsed < duration:
+                func(data, 0x5A)
+                count += 1
+                elapsed = time.perf_counter() - start
+            results.append({
+                "method": name,
+                "size": size,
+                "mb_s": size * count / elapsed / 1e6,
+            })
+    return results
+
+
+def benchmark_suites(sizes=(64, 4096, 1024 * 1024), duration=0.5, names=None, batch=64):
+    """Débit (Mo/s) de chaque suite : une couche à la fois et par lots de batch
+    couches, plus la latence d'un saut (déchiffrement d'une couche, µs).
+
+    Renvoie une liste de dicts {suite, size, encrypt_mb_s, decrypt_mb_s, batch_mb_s, hop_us}.
+    """
+    results = []
+    for name in names or available_suites():
+        s = suite(name)
+        for size in sizes:
+            data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+            sealed = s.encrypt(data, 12345)
+            assert s.decrypt(sealed, 12345) == data, name
+            items = [(data, 12345 + i % 4) for i in range(batch)]
+            encrypt_s = timed_calls(lambda: s.encrypt(data, 12345), duration)
+            decrypt_s = timed_calls(lambda: s.decrypt(sealed, 12345), duration)
+            batch_s = timed_calls(lambda: s.encrypt_batch(items), duration) / batch
+            results.append({
+                "suite": name,
+                "size": size,
+                "encrypt_mb_s": size / encrypt_s / 1e6,
+                "decrypt_mb_s": size / decrypt_s / 1e6,
+                "batch_mb_s": size / batch_s / 1e6,
+                "hop_us": decrypt_s * 1e6,
+            })
+    return results
+
+
+def timed_calls(func, duration):
+    """Durée moyenne d'un appel (s)."""
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < duration:
+        func()
+        count += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / count
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="onion-cipher", description="Débit des méthodes XOR et des suites")
+    parser.add_argument("--sizes", default="64,4096,1048576", help="tailles de couche (octets)")
+    parser.add_argument("--suites", default="", help="suites mesurées (défaut : toutes celles disponibles)")
+    parser.add_argument("--duration", type=float, default=0.5, help="secondes par mesure")
+    args = parser.parse_args(argv)
+    sizes = [int(v) for v in args.sizes.split(",") if v]
+    for r in benchmark(sizes, args.duration):
+        print(f"{r['method']:>10} {r['size']:>9} o  {r['mb_s']:10.1f} Mo/s")
+    print()
+    print(f"{'suite':>10} {'taille':>11}  {'chiffre':>10}  {'déchiffre':>10}  {'par lots':>10}  {'un saut':>10}")
+    for r in benchmark_suites(sizes, args.duration, [n for n in args.suites.split(",") if n]):
+        print(f"{r['suite']:>10} {r['size']:>9} o  {r['encrypt_mb_s']:6.1f} Mo/s  {r['decrypt_mb_s']:6.1f} Mo/s  "
+              f"{r['batch_mb_s']:6.1f} Mo/s  {r['hop_us']:7.1f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
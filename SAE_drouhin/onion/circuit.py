@@ -0,0 +1,93 @@
+"""Circuits : le chemin est construit une fois, les messages suivants ne
+portent plus qu'un identifiant de circuit et un corps chiffré.
+
+CREATE  <id 8 o><onion>   chaque couche déchiffrée = "<saut suivant>|<couche suivante>",
+                          la dernière = "|<destination>" ; chaque routeur tire un
+                          nouvel id pour le lien suivant et mémorise
+                          (lien, id) → (saut suivant, id suivant) ou (None, destination)
+CELL    <id 8 o><corps>   corps chiffré une fois par routeur du chemin ; chaque routeur
+                          retire sa couche et transmet au saut mémorisé
+DESTROY <id 8 o>          oubli du circuit, propagé le long du chemin
+
+Côté client → Master, CREATE est précédé de l'entrée comme ONION
+("R1:" ou "*R2:"), le Master retient id → routeur d'entrée pour les CELL.
+"""
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from onion.keys import seal, seal_batch
+
+CIRC_ID = struct.Struct("!Q")
+MAX_CIRCUITS = 100000
+
+
+def new_circuit_id():
+    return int.from_bytes(os.urandom(CIRC_ID.size), "big")
+
+
+def split_circuit(payload):
+    """payload de CREATE/CELL/DESTROY → (id, reste)."""
+    if len(payload) < CIRC_ID.size:
+        raise ValueError("trame de circuit trop courte")
+    return CIRC_ID.unpack_from(payload)[0], memoryview(payload)[CIRC_ID.size:]
+
+
+def build_create(hops, keys, dest, suite=None):
+    """Onion de création pour hops (sans l'entrée '*' éventuelle) ; keys : nom → (époque, clé)."""
+    current = b"|" + dest.encode("utf-8")
+    for i, router in enumerate(reversed(hops)):
+        if i:
+            current = hops[len(hops) - i].encode("utf-8") + b"|" + current
+        current = seal(current, keys[router], suite)
+    return current
+
+
+def wrap_cell(hops, keys, body, suite=None):
+    """Chiffre body une fois par routeur, du dernier au premier."""
+    for router in reversed(hops):
+        body = seal(body, keys[router], suite)
+    return body
+
+
+def wrap_cells(hops, keys, bodies, suite=None):
+    """wrap_cell pour plusieurs corps du même circuit : un lot par routeur."""
+    for router in reversed(hops):
+        bodies = seal_batch(bodies, keys[router], suite)
+    return bodies
+
+
+class CircuitTable:
+    """Table des circuits d'un routeur : (lien d'arrivée, id) → (saut suivant, id sur ce lien)
+    ou (None, destination) pour le dernier routeur.
+
+    Bornée (les circuits les plus anciennement utilisés sont oubliés) et
+    partagée entre le lien Master et les liens directs, d'où le verrou.
+    """
+
+    def __init__(self, capacity=MAX_CIRCUITS):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, circ_id, next_hop, dest):
+        with self.lock:
+            self.entries[circ_id] = (next_hop, dest)
+            self.entries.move_to_end(circ_id)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def get(self, circ_id):
+        with self.lock:
+            entry = self.entries.get(circ_id)
+            if entry is not None:
+                self.entries.move_to_end(circ_id)
+            return entry
+
+    def pop(self, circ_id):
+        with self.lock:
+            return self.entries.pop(circ_id, None)
+
+    def __len__(self):
+        return len(self.entries)
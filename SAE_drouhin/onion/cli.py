@@ -0,0 +1,303 @@
+"""Points d'entrée en ligne de commande (sans PyQt).
+
+    python -m onion master --port 9000
+    python -m onion router --name R2 --master 127.0.0.1:9000
+    python -m onion client --name Client_A --dest Client_B
+    python -m onion bench --routers 3 --clients 8 --out bench.json
+    python -m onion cipher --sizes 64,4096
+
+main_master / main_router / main_client sont aussi utilisables comme
+scripts onion-master, onion-router, onion-client. Chaque rôle n'importe que
+ses modules : un routeur ou un client démarre sans charger asyncio ni Qt.
+"""
+import argparse
+import sys
+
+from onion.logbuf import LEVELS, Logger
+
+
+def add_log_options(parser):
+    parser.add_argument("--log-level", choices=sorted(LEVELS, key=LEVELS.get), default="info",
+                        help="debug affiche chaque message relayé (coûteux)")
+    parser.add_argument("--log-sample", action="append", default=[], metavar="CATEGORIE=N",
+                        help="ne garder qu'un log sur N pour une catégorie (ex: trafic=100)")
+
+
+def add_metrics_options(parser):
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="sert les métriques Prometheus sur http://<hôte>:<port>/metrics")
+    parser.add_argument("--metrics-host", default="127.0.0.1")
+
+
+def add_compress_options(parser):
+    from onion.compress import CODECS, THRESHOLD
+    parser.add_argument("--compress", choices=("auto", "none", *CODECS), default="none",
+                        help="compression des messages proposée au Master (auto = la meilleure disponible)")
+    parser.add_argument("--compress-threshold", type=int, default=THRESHOLD,
+                        help="taille minimale (octets) d'un message compressé")
+
+
+def add_reconnect_options(parser):
+    parser.add_argument("--reconnect-max", type=float, default=30.0, metavar="SECONDES",
+                        help="délai maximal entre deux tentatives de reconnexion au Master")
+
+
+def add_cipher_options(parser):
+    from onion.cipher import DEFAULT_SUITE, SUITES
+    parser.add_argument("--cipher", choices=tuple(SUITES), default=DEFAULT_SUITE,
+                        help="suite de chiffrement des couches, imposée aux routeurs et aux clients "
+                             "(chacha20 et aesgcm demandent le paquet cryptography)")
+
+
+def add_layer_options(parser):
+    parser.add_argument("--layer-version", type=int, choices=(1, 2), default=2,
+                        help="format des couches d'onion (1 = texte, tant que des routeurs ne lisent que celui-là)")
+
+
+def make_logger(args):
+    logger = Logger(LEVELS[args.log_level])
+    for spec in args.log_sample:
+        category, _, every = spec.partition("=")
+        logger.set_sampling(category, int(every or 1))
+    return logger.to_console()
+
+
+def main_master(argv=None):
+    parser = argparse.ArgumentParser(prog="onion-master", description="Master Onion sans interface")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--high-water", type=int, default=1024 * 1024,
+                        help="octets en file par pair au-delà desquels la politique s'applique")
+    parser.add_argument("--low-water", type=int, default=256 * 1024,
+                        help="seuil de reprise pour la politique block")
+    parser.add_argument("--client-policy", choices=("drop", "block"), default="drop")
+    parser.add_argument("--router-policy", choices=("drop", "block"), default="block")
+    parser.add_argument("--entry-policy", choices=("least_loaded", "round_robin"), default="least_loaded",
+                        help="choix du routeur d'entrée quand le client envoie un chemin '*,...' ou 'auto'")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processus acceptant sur le même port (SO_REUSEPORT), un par cœur")
+    parser.add_argument("--cluster-name", help="nom unique de ce Master dans la fédération (défaut: hôte:port)")
+    parser.add_argument("--cluster-listen", metavar="HOTE:PORT",
+                        help="écoute des liens venant des autres Masters")
+    parser.add_argument("--cluster-advertise", metavar="HOTE:PORT",
+                        help="adresse donnée aux autres Masters (défaut: --cluster-listen)")
+    parser.add_argument("--peer", action="append", default=[], metavar="HOTE:PORT",
+                        help="Master à joindre (répétable ; un seul suffit, les autres sont appris)")
+    parser.add_argument("--key-rotation", type=float, default=3600.0, metavar="SECONDES",
+                        help="renouvellement des clés des routeurs (0 = jamais)")
+    parser.add_argument("--key-overlap", type=float, default=60.0, metavar="SECONDES",
+                        help="durée pendant laquelle l'ancienne clé reste acceptée")
+    parser.add_argument("--heartbeat-interval", type=float, default=10.0, metavar="SECONDES",
+                        help="PING vers chaque client et routeur (0 = aucun)")
+    parser.add_argument("--idle-timeout", type=float, default=30.0, metavar="SECONDES",
+                        help="un pair muet depuis ce délai est déconnecté (0 = jamais)")
+    parser.add_argument("--mailbox-dir", metavar="DOSSIER",
+                        help="messages des clients hors ligne gardés ici d'un démarrage à l'autre "
+                             "(défaut: dossier temporaire)")
+    parser.add_argument("--mailbox-ttl", type=float, default=24 * 3600.0, metavar="SECONDES",
+                        help="durée de garde d'un message pour un client hors ligne")
+    parser.add_argument("--mailbox-memory", type=int, default=256 * 1024, metavar="OCTETS",
+                        help="octets gardés en mémoire par client hors ligne, le reste sur disque")
+    parser.add_argument("--mailbox-max", type=int, default=16 * 1024 * 1024, metavar="OCTETS",
+                        help="octets gardés au plus par client hors ligne (mémoire + disque)")
+    add_cipher_options(parser)
+    add_layer_options(parser)
+    add_log_options(parser)
+    add_metrics_options(parser)
+    args = parser.parse_args(argv)
+
+    if args.heartbeat_interval and 0 < args.idle_timeout <= args.heartbeat_interval:
+        print("--idle-timeout doit dépasser --heartbeat-interval", file=sys.stderr)
+        return 2
+    from onion.cipher import available_suites
+    if args.cipher not in available_suites():
+        print(f"--cipher {args.cipher} indisponible ici (paquet cryptography absent ?)", file=sys.stderr)
+        return 2
+    federated = args.cluster_listen or args.peer
+    if federated and args.workers > 1:
+        print("--workers et la fédération (--cluster-listen/--peer) ne se combinent pas", file=sys.stderr)
+        return 2
+    if args.workers <= 1:
+        run_master(args)
+        return 0
+
+    import multiprocessing
+    import socket
+
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("--workers demande SO_REUSEPORT (Linux, BSD, macOS)", file=sys.stderr)
+        return 2
+    workers = [multiprocessing.Process(target=run_master, args=(args, i), name=f"master-w{i}")
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    return 0
+
+
+def run_master(args, worker=None):
+    """Un Master, ou le worker numéro worker d'un Master multi-processus."""
+    import os
+    import socket
+
+    from onion.cluster import worker_address
+    from onion.master import AsyncMaster
+
+    cluster = {}
+    metrics_port = args.metrics_port
+    if args.cluster_listen or args.peer:
+        cluster = {
+            "cluster_name": args.cluster_name or f"{socket.gethostname()}:{args.port}",
+            "cluster_listen": args.cluster_listen,
+            "cluster_peers": args.peer,
+            "cluster_advertise": args.cluster_advertise,
+        }
+    elif worker is not None:
+        # Chaque worker écoute sur son socket Unix et rejoint les précédents
+        cluster = {
+            "cluster_name": f"w{worker}",
+            "cluster_listen": worker_address(args.port, worker),
+            "cluster_peers": [worker_address(args.port, i) for i in range(worker)],
+        }
+        if metrics_port is not None:
+            metrics_port += worker
+    mailbox_dir = args.mailbox_dir
+    if mailbox_dir and worker is not None:
+        mailbox_dir = os.path.join(mailbox_dir, f"w{worker}")  # une boîte par worker
+
+    master = AsyncMaster(
+        logger=make_logger(args),
+        high_water=args.high_water,
+        low_water=args.low_water,
+        client_policy=args.client_policy,
+        router_policy=args.router_policy,
+        entry_policy=args.entry_policy,
+        metrics_port=metrics_port,
+        metrics_host=args.metrics_host,
+        key_rotation=args.key_rotation,
+        key_overlap=args.key_overlap,
+        mailbox_dir=mailbox_dir,
+        mailbox_ttl=args.mailbox_ttl,
+        mailbox_memory=args.mailbox_memory,
+        mailbox_max=args.mailbox_max,
+        heartbeat_interval=args.heartbeat_interval,
+        idle_timeout=args.idle_timeout,
+        layer_version=args.layer_version,
+        cipher_suite=args.cipher,
+        **cluster,
+    )
+    try:
+        master.run(args.port, args.host, reuse_port=worker is not None)
+    except KeyboardInterrupt:
+        pass
+
+
+def main_router(argv=None):
+    parser = argparse.ArgumentParser(prog="onion-router", description="Routeur Onion sans interface")
+    parser.add_argument("--name", required=True, help="R1, R2, ...")
+    parser.add_argument("--master", default="127.0.0.1:9000")
+    parser.add_argument("--listen-port", type=int, default=0,
+                        help="port des liens directs entre routeurs (0 = automatique)")
+    parser.add_argument("--decrypt-workers", type=int, default=0,
+                        help="threads de déchiffrement (0 = tout dans le thread de réception)")
+    parser.add_argument("--process-workers", type=int, default=0,
+                        help="processus de déchiffrement pour les grosses couches (plusieurs cœurs)")
+    parser.add_argument("--process-threshold", type=int, default=64 * 1024,
+                        help="taille (octets) à partir de laquelle une couche part dans un processus")
+    parser.add_argument("--unordered", action="store_true",
+                        help="relaie chaque couche dès qu'elle est déchiffrée, sans garder l'ordre d'arrivée")
+    add_reconnect_options(parser)
+    add_log_options(parser)
+    add_metrics_options(parser)
+    args = parser.parse_args(argv)
+
+    from onion.router import RouterNode
+
+    try:
+        ok = RouterNode(args.name, args.master, args.listen_port, logger=make_logger(args),
+                        metrics_port=args.metrics_port, metrics_host=args.metrics_host,
+                        decrypt_workers=args.decrypt_workers, process_workers=args.process_workers,
+                        process_threshold=args.process_threshold, ordered=not args.unordered,
+                        reconnect_max=args.reconnect_max).run()
+    except KeyboardInterrupt:
+        return 0
+    return 0 if ok else 1
+
+
+def main_client(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="onion-client",
+        description="Client Onion sans interface : chaque ligne de stdin est envoyée à --dest",
+    )
+    parser.add_argument("--name", required=True, help="Client_A, Client_B, ...")
+    parser.add_argument("--master", default="127.0.0.1:9000")
+    parser.add_argument("--path", default="R1,R2,R3",
+                        help='"R1,R2,R3", "*,R2,R3" (entrée choisie par le Master) ou "auto"')
+    parser.add_argument("--dest", required=True)
+    parser.add_argument("--no-circuits", action="store_true",
+                        help="un onion complet par message au lieu d'un circuit réutilisé")
+    parser.add_argument("--send-file", action="append", default=[], metavar="FICHIER",
+                        help="envoie ce fichier à --dest par morceaux avant de lire stdin (répétable)")
+    parser.add_argument("--download-dir", default="downloads", help="dossier des fichiers reçus")
+    add_compress_options(parser)
+    add_reconnect_options(parser)
+    add_layer_options(parser)
+    add_log_options(parser)
+    args = parser.parse_args(argv)
+
+    import threading
+    from onion.client import ClientNode
+
+    node = ClientNode(args.name, args.master, logger=make_logger(args),
+                      use_circuits=not args.no_circuits, download_dir=args.download_dir,
+                      compression=args.compress, compress_threshold=args.compress_threshold,
+                      reconnect_max=args.reconnect_max, layer_version=args.layer_version)
+    try:
+        frames = node.connect()
+    except Exception as e:
+        print(f"Connexion échouée: {e}", file=sys.stderr)
+        return 1
+    # Master perdu ensuite : reconnexion automatique, les lignes lues entre-temps attendent
+    threading.Thread(target=node.connect_loop, args=(frames,), daemon=True).start()
+    try:
+        for file_path in args.send_file:
+            node.send_file(args.path, args.dest, file_path)
+        for line in sys.stdin:
+            node.send_message(args.path, args.dest, line.rstrip("\n"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.close()
+    return 0
+
+
+def main_bench(argv=None):
+    from onion.bench import main
+    return main(argv)
+
+
+def main_cipher(argv=None):
+    from onion.cipher import main
+    return main(argv)
+
+
+COMMANDS = {
+    "master": main_master,
+    "router": main_router,
+    "client": main_client,
+    "bench": main_bench,
+    "cipher": main_cipher,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: python -m onion {{{','.join(COMMANDS)}}} [options]", file=sys.stderr)
+        return 2
+    return COMMANDS[argv[0]](argv[1:])
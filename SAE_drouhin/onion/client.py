@@ -0,0 +1,367 @@
+"""Client sans interface : handshake avec le Master, construction et envoi des onions.
+
+Client_A.py / Client_B.py et la commande `python -m onion client` n'en sont
+que des vues.
+"""
+import os
+import random
+import socket
+
+from onion import cipher, compress, framing, layer
+from onion.circuit import CIRC_ID, build_create, new_circuit_id, wrap_cell, wrap_cells
+from onion.framing import FramedConnection, parse_address
+from onion.keys import parse_key
+from onion.logbuf import ERROR, INFO, WARNING, Logger
+from onion.reconnect import BACKOFF_MAX, CONNECT_TIMEOUT, Backoff, Outbox, Supervisor
+from onion.stream import (CHUNK_SIZE, CREDIT, FIN, OPEN, OutgoingStream, StreamAssembler, encode_chunk,
+                          new_stream_id)
+
+AUTO_HOPS = 3  # longueur des chemins "auto", entrée comprise
+
+
+class ClientObserver:
+    """Observateur par défaut : affiche dans la console."""
+
+    def status_changed(self, text):
+        print(f"[{text}]")
+
+    def message_received(self, sender, text):
+        print(f"{sender}: {text}")
+
+    def file_received(self, sender, path, size):
+        print(f"{sender}: fichier reçu {path} ({size} o)")
+
+
+class ClientNode:
+    def __init__(self, name, master_addr, observer=None, logger=None, use_circuits=True, download_dir="downloads",
+                 compression="none", compress_threshold=compress.THRESHOLD, reconnect_max=BACKOFF_MAX,
+                 layer_version=layer.V2):
+        self.name = name
+        self.master_addr = master_addr
+        self.observer = observer or ClientObserver()
+        self.logger = logger or Logger().to_console()
+        self.sock = None
+        self.router_pub_keys = {}  # nom → (époque, clé) courante
+        self.use_circuits = use_circuits
+        self.circuits = {}  # (chemin, destination) → (id brut, sauts)
+        self.layer_version = layer_version  # 1 tant que des routeurs du chemin ne lisent que l'ancien format
+        self.suite = cipher.SUITES[cipher.DEFAULT_SUITE]  # imposée par le Master dans KEYS
+        self.outgoing = {}  # id flux → OutgoingStream (crédit restant)
+        self.incoming = StreamAssembler(download_dir, self.send_credit, self.stream_done)
+        # Compressions proposées au Master ("auto" = toutes celles disponibles ici)
+        if compression == "auto":
+            self.offered = compress.available()
+        else:
+            self.offered = [compression] if compression and compression != "none" else []
+        self.compress_threshold = compress_threshold
+        self.compressor = None  # compress.Compressor une fois la négociation faite
+        # Messages écrits pendant une coupure, envoyés en un lot à la reconnexion
+        self.outbox = Outbox()
+        self.supervisor = Supervisor(self.connect, self.listen_loop, master_addr, log=self.log,
+                                     on_status=self.observer.status_changed, backoff=Backoff(maximum=reconnect_max))
+        self.init_handlers()
+
+    def init_handlers(self):
+        """Table type de trame → handler(données)."""
+        self.handlers = framing.Dispatcher()
+        self.handlers.register(self.incoming.feed, framing.CHUNK)
+        self.handlers.register(self.grant_credit, framing.WINDOW)
+        self.handlers.register(lambda data: self.parse_keys(data.decode('utf-8')), framing.KEYS)
+        self.handlers.register(lambda data: self.update_keys(data.decode('utf-8')), framing.REKEY)
+        self.handlers.register(self.answer_ping, framing.PING)
+        self.handlers.register(self.receive_message, framing.FROM)
+
+    def log(self, msg, level=INFO, category="general"):
+        self.logger.log(msg, level, category)
+
+    def parse_keys(self, keys_data):
+        """Annonce KEYS du Master : routeurs connectés et leurs clés (renvoyée à chaque changement)."""
+        keys = {}
+        suite = cipher.DEFAULT_SUITE
+        for info in keys_data.split("|"):
+            if not info:
+                continue
+            if info.startswith("+"):
+                suite = info[1:]  # suite de chiffrement du Master
+                continue
+            if info.startswith("~"):
+                # compression retenue par le Master (réponse au HELLO seulement)
+                self.compressor = compress.Compressor(info[1:], self.compress_threshold)
+                self.log(f"Compression: {info[1:]} (à partir de {self.compress_threshold} o)")
+                continue
+            name, key = info.split(":")
+            keys[name] = parse_key(key)
+        old, self.router_pub_keys = self.router_pub_keys, keys
+        if suite != self.suite.name:
+            self.suite = cipher.suite(suite)  # annoncée au HELLO : disponible ici
+            self.log(f"Chiffrement: {suite}")
+            self.reset_circuits()
+        else:
+            # Seuls les circuits touchés par un routeur parti ou dont la clé a changé
+            # (un routeur qui arrive ne casse aucun circuit)
+            self.reset_circuits({name for name, key in old.items() if keys.get(name) != key})
+        self.log(f"Clés: {self.router_pub_keys}")
+        if len(self.outbox) and self.outbox.open:
+            # messages qui attendaient un routeur pas encore revenu
+            self.flush_outbox()
+
+    def update_keys(self, keys_data):
+        """REKEY : nouvelles clés de quelques routeurs après rotation. Les circuits
+        restent valides : chaque couche porte l'époque de sa clé."""
+        for info in keys_data.split("|"):
+            name, key = info.split(":")
+            self.router_pub_keys[name] = parse_key(key)
+        self.log(f"Clés renouvelées: {keys_data}")
+
+    def resolve_path(self, path):
+        """'R1,R2,R3' → ['R1', 'R2', 'R3'].
+
+        "*" en tête laisse le Master choisir le routeur d'entrée (le moins
+        chargé) ; "auto" = "*" suivi de routeurs tirés au hasard.
+        """
+        if path.strip().lower() == "auto":
+            routers = sorted(self.router_pub_keys)
+            return ["*"] + random.sample(routers, min(AUTO_HOPS - 1, len(routers)))
+        return [h.strip() for h in path.split(",") if h.strip()]
+
+    def pack(self, message):
+        """Texte du message en octets, compressé si négocié (une fois, avant les couches)."""
+        data = message.encode('utf-8')
+        return self.compressor.pack(data) if self.compressor else data
+
+    def build_onion(self, hops, dest, message):
+        """Couches au format layer_version (onion/layer.py), la dernière pour le routeur de sortie."""
+        return layer.build_onion(hops, self.router_pub_keys, dest, self.pack(message), self.layer_version,
+                                 self.suite)
+
+    def split_entry(self, hops):
+        """(entrée annoncée au Master, sauts chiffrés par le client)."""
+        if hops and hops[0] != "*":
+            return hops[0], hops
+        # Entrée choisie par le Master : on lui indique seulement notre premier saut
+        hops = hops[1:]
+        return "*" + (hops[0] if hops else ""), hops
+
+    def open_circuit(self, path, dest, frames=None):
+        """Circuit vers dest par path, construit au premier message puis réutilisé.
+
+        Le CREATE part aussitôt, ou est ajouté à frames (envoi groupé).
+        """
+        circuit = self.circuits.get((path, dest))
+        if circuit is None:
+            entry, hops = self.split_entry(self.resolve_path(path))
+            circ = CIRC_ID.pack(new_circuit_id())
+            onion = build_create(hops, self.router_pub_keys, dest, self.suite)
+            create = (framing.CREATE, framing.name_header(entry) + circ + onion)
+            if frames is None:
+                self.sock.send(*create)
+            else:
+                frames.append(create)
+            circuit = self.circuits[(path, dest)] = (circ, hops)
+        return circuit
+
+    def entry_by_master(self, path):
+        """True si le Master choisit le routeur d'entrée ("*,R2", "auto")."""
+        return path.strip().lower() == "auto" or self.resolve_path(path)[:1] == ["*"]
+
+    def reset_circuits(self, routers=None):
+        """Routeurs ou clés changés : les circuits qui passent par routers (tous
+        par défaut) seront reconstruits au prochain envoi. Ceux dont le Master a
+        choisi l'entrée, inconnue ici, le sont dès qu'un routeur change."""
+        stale = [route for route, (_, hops) in self.circuits.items()
+                 if routers is None or not routers.isdisjoint(hops)
+                 or (routers and self.entry_by_master(route[0]))]
+        for route in stale:
+            circ, _ = self.circuits.pop(route)
+            if self.sock:
+                self.sock.send(framing.DESTROY, circ)
+
+    def connect(self):
+        """Connexion + HELLO ; renvoie l'itérateur de trames après réception des clés.
+
+        Aussi appelé à chaque reconnexion : le Master a oublié nos circuits,
+        les messages en attente partent ensuite en un lot.
+        """
+        host, port = parse_address(self.master_addr)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect((host, port))
+        self.sock = FramedConnection(sock)
+        self.compressor = None
+        self.circuits = {}
+        # "Client_A|<compressions>|<suites de chiffrement>"
+        hello = f"{self.name}|{','.join(self.offered)}|{','.join(cipher.available_suites())}"
+        self.sock.send(framing.HELLO, hello)
+
+        frames = self.sock.frames()
+        ftype, data = next(frames, (None, b""))
+        if ftype != framing.KEYS:
+            self.sock.close()
+            self.sock = None
+            raise ConnectionError("Réponse Master inattendue")
+        sock.settimeout(None)  # ensuite, délai annoncé par les PING du Master
+        self.parse_keys(data.decode('utf-8'))
+        self.flush_outbox()
+        return frames
+
+    def connect_loop(self, frames=None):
+        """Bloquant : se connecte, écoute, et se reconnecte (délai croissant)
+        quand le lien tombe, jusqu'à close(). frames : première connexion
+        déjà faite par l'appelant."""
+        try:
+            self.supervisor.run(frames)
+        except Exception as e:
+            self.observer.status_changed(f"Connexion échouée: {e}")
+
+    def flush_outbox(self):
+        sent = self.outbox.reopen(self.replay)
+        if sent:
+            self.log(f"📤 {sent} messages écrits pendant la coupure envoyés")
+
+    def replay(self, items):
+        """Messages en attente → un seul envoi groupé. Renvoie ceux dont un
+        routeur du chemin n'est pas (encore) revenu.
+
+        Avec les circuits, les messages d'un même circuit sont chiffrés par
+        lots (une couche de tous les messages à la fois), dans leur ordre.
+        """
+        frames = []
+        waiting = []
+        if self.use_circuits:
+            groups = {}  # (chemin, destination) → éléments de la file (les mêmes objets, voir Outbox)
+            for item in items:
+                groups.setdefault(item[:2], []).append(item)
+            for (path, dest), group in groups.items():
+                try:
+                    circ, hops = self.open_circuit(path, dest, frames)
+                    bodies = wrap_cells(hops, self.router_pub_keys, [self.pack(m) for _, _, m in group], self.suite)
+                except KeyError:
+                    waiting.extend(group)
+                    continue
+                frames.extend((framing.CELL, circ + body) for body in bodies)
+        else:
+            for item in items:
+                try:
+                    self.prepare_message(*item, frames)
+                except KeyError:
+                    waiting.append(item)
+        if frames:
+            self.sock.send_batch(frames)
+        return waiting
+
+    def listen_loop(self, frames):
+        try:
+            for ftype, data in frames:
+                handler = self.handlers.get(ftype)
+                if handler:
+                    handler(data)
+        except Exception as e:
+            self.log(f"{e}", ERROR)
+        self.outbox.close()
+        self.incoming.close()
+        self.observer.status_changed("Déconnecté")
+
+    def grant_credit(self, data):
+        stream_id, credit = CREDIT.unpack_from(data)
+        stream = self.outgoing.get(stream_id)
+        if stream:
+            stream.grant(credit)
+
+    def answer_ping(self, data):
+        # Master muet au-delà du délai annoncé : la lecture échoue, reconnexion
+        self.sock.send(framing.PONG, data)
+        self.sock.settimeout(framing.idle_timeout(data))
+
+    def receive_message(self, data):
+        sender, text = framing.split_named(data)
+        self.observer.message_received(sender.decode('utf-8'), bytes(text).decode('utf-8'))
+
+    def send_message(self, path, dest, message):
+        """Envoie message à dest par path ("R1,R2,R3", "*,R2,R3" ou "auto").
+
+        Avec les circuits, l'onion complet n'est construit qu'au premier
+        message ; les suivants ne portent que l'id du circuit et le corps.
+        Lien coupé : le message attend la reconnexion (onion/reconnect.py).
+
+        False si jamais connecté, ou si la file d'attente est pleine.
+        """
+        if not message or not self.sock:
+            return False
+        if not self.outbox.submit((path, dest, message), len(message), self.send_now):
+            self.log(f"⚠️ Master injoignable et file d'attente pleine : message pour {dest} abandonné", WARNING)
+            return False
+        return True
+
+    def send_now(self, item):
+        frames = []
+        self.prepare_message(*item, frames)
+        self.sock.send_batch(frames)
+
+    def prepare_message(self, path, dest, message, frames):
+        """Ajoute à frames les trames du message (CREATE éventuel, puis CELL ou ONION).
+
+        L'onion est construit au moment de l'envoi : après une reconnexion,
+        avec les clés du nouveau HELLO. KeyError si un routeur est inconnu.
+        """
+        if self.use_circuits:
+            circ, hops = self.open_circuit(path, dest, frames)
+            body = wrap_cell(hops, self.router_pub_keys, self.pack(message), self.suite)
+            frames.append((framing.CELL, circ + body))
+            return
+
+        entry, hops = self.split_entry(self.resolve_path(path))
+        onion = self.build_onion(hops, dest, message)
+        frames.append((framing.ONION, framing.name_header(entry) + onion))
+
+    def send_file(self, path, dest, file_path):
+        """Envoie le fichier file_path à dest par morceaux sur un circuit (onion/stream.py).
+
+        Bloquant : à appeler hors du thread d'écoute, qui reçoit le crédit.
+        Ne lit qu'un morceau à la fois ; TimeoutError si le destinataire
+        cesse de rendre du crédit. False si non connecté.
+        """
+        if not self.sock:
+            return False
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            self.send_stream(path, dest, f, os.path.basename(file_path), size)
+        return True
+
+    def send_stream(self, path, dest, source, name, size):
+        """Envoie size octets lus dans source (fichier binaire) sous le nom name."""
+        circ, hops = self.open_circuit(path, dest)
+        stream = OutgoingStream(new_stream_id())
+        self.outgoing[stream.stream_id] = stream
+        try:
+            meta = f"{self.name}|{name}|{size}".encode('utf-8')
+            self.send_chunk(circ, hops, stream, 0, OPEN, meta)
+            seq = 1
+            data = source.read(CHUNK_SIZE)
+            while True:
+                following = source.read(CHUNK_SIZE) if data else b""
+                last = not following
+                self.send_chunk(circ, hops, stream, seq, FIN if last else 0, data)
+                if last:
+                    break
+                data = following
+                seq += 1
+            self.log(f"📤 {name} ({size} o) envoyé à {dest} en {seq} morceaux")
+        finally:
+            del self.outgoing[stream.stream_id]
+
+    def send_chunk(self, circ, hops, stream, seq, flags, data):
+        stream.acquire()
+        body = wrap_cell(hops, self.router_pub_keys, encode_chunk(stream.stream_id, seq, flags, data), self.suite)
+        self.sock.send(framing.DATA, circ + body)
+
+    def send_credit(self, sender, stream_id, credit):
+        self.sock.send(framing.WINDOW, framing.name_header(sender) + CREDIT.pack(stream_id, credit))
+
+    def stream_done(self, stream):
+        self.log(f"📥 {stream.name} reçu de {stream.sender} → {stream.path}")
+        self.observer.file_received(stream.sender, stream.path, stream.received)
+
+    def close(self):
+        self.supervisor.stop()
+        if self.sock:
+            self.sock.close()
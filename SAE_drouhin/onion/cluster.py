@@ -0,0 +1,276 @@
+"""Liens entre Masters : workers d'une même machine ou Masters fédérés.
+
+En mode --workers N, N processus écoutent sur le même port (SO_REUSEPORT) :
+le noyau répartit les connexions entrantes, chaque client ou routeur est
+donc servi par un seul worker. Les workers sont reliés par des sockets Unix
+locaux. En fédération (--cluster-listen / --peer), des Masters sur des
+hôtes différents sont reliés par TCP de la même façon. Entre Masters :
+
+HELLO    <nom du Master>
+MASTERS  <nom>=<adresse>|...         membres connus (gossip) : chacun joint
+                                     ceux qu'il ne connaît pas encore, une
+                                     seule adresse de départ suffit
+OWN      <nom>[|<clé>|<hôte>:<port>] ce pair est servi ici (routeur : clé et
+                                     adresse des liens directs)
+GONE     <nom>                       ce pair est parti
+RELAY    <nom: pair><type><payload>  trame à remettre au pair local (nom
+                                     préfixé de sa longueur, type sur 1 octet)
+
+Chaque Master garde la table nom → Master propriétaire ; une trame pour un
+pair servi ailleurs part telle quelle dans un RELAY vers son propriétaire.
+Les Masters finissent reliés deux à deux : les OWN viennent toujours du
+propriétaire lui-même.
+"""
+import asyncio
+import os
+import tempfile
+
+from onion import framing
+from onion.framing import StreamConnection, parse_address
+from onion.logbuf import INFO, WARNING
+from onion.sendqueue import BLOCK, PeerSender
+
+LINK_HIGH_WATER = 8 * 1024 * 1024
+LINK_LOW_WATER = 2 * 1024 * 1024
+
+
+def worker_address(port, index):
+    """Socket Unix du worker index pour un Master sur port."""
+    return "unix:" + os.path.join(tempfile.gettempdir(), f"onion-master-{port}-w{index}.sock")
+
+
+async def open_link(addr):
+    if addr.startswith("unix:"):
+        return await asyncio.open_unix_connection(addr[5:])
+    host, port = parse_address(addr)
+    return await asyncio.open_connection(host, port)
+
+
+async def start_link_server(addr, handler):
+    if addr.startswith("unix:"):
+        path = addr[5:]
+        if os.path.exists(path):
+            os.unlink(path)  # socket d'un worker précédent
+        return await asyncio.start_unix_server(handler, path)
+    host, port = parse_address(addr)
+    return await asyncio.start_server(handler, host, port, reuse_address=True)
+
+
+def relay_parts(name, ftype, payload):
+    """Payload RELAY en morceaux : l'en-tête, puis le payload d'origine sans recopie."""
+    head = framing.name_header(name) + bytes((ftype,))
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if isinstance(payload, (tuple, list)):
+        return [head, *payload]
+    return [head, payload]
+
+
+def decode_relay(data):
+    """RELAY → (nom, type, payload en memoryview)."""
+    name, rest = framing.split_named(data)
+    if not len(rest):
+        raise ValueError("RELAY mal formé")
+    return name.decode('utf-8'), rest[0], rest[1:]
+
+
+class Cluster:
+    """Table de propriété partagée et liens vers les autres Masters.
+
+    master est l'AsyncMaster local : il fournit deliver_or_store(), ownership()
+    et les rappels remote_joined() / remote_left().
+    """
+
+    def __init__(self, master, name, listen=None, peers=(), advertise=None):
+        self.master = master
+        self.name = name
+        self.listen = listen
+        self.advertise = advertise or listen  # adresse donnée aux autres Masters
+        self.peers = list(peers)
+        self.links = {}  # nom du Master pair → PeerSender
+        self.owners = {}  # nom de client/routeur → nom du Master qui le sert
+        self.members = {}  # nom de Master → adresse de liens (gossip)
+        if self.advertise:
+            self.members[name] = self.advertise
+        self.dialing = set()
+        self.server = None
+        self.tasks = []
+        self.closed = False
+        self.handlers = framing.Dispatcher()  # type de trame → handler(pair, données)
+        self.handlers.register(self.on_relay, framing.RELAY)
+        self.handlers.register(self.on_own, framing.OWN)
+        self.handlers.register(self.on_gone, framing.GONE)
+        self.handlers.register(lambda peer, data: self.merge_members(data.decode('utf-8')), framing.MASTERS)
+
+    def log(self, msg, level=INFO):
+        self.master.log(f"[{self.name}] {msg}", level, "cluster")
+
+    async def start(self):
+        if self.listen:
+            self.server = await start_link_server(self.listen, self.accept)
+        for addr in self.peers:
+            self.dial_to(addr)
+
+    def dial_to(self, addr):
+        if addr in self.dialing or addr == self.advertise:
+            return
+        self.dialing.add(addr)
+        self.tasks.append(asyncio.ensure_future(self.dial(addr)))
+
+    def member_at(self, addr):
+        for name, member_addr in self.members.items():
+            if member_addr == addr:
+                return name
+        return None
+
+    async def dial(self, addr):
+        """Lien sortant vers un autre Master, rétabli tant que le cluster tourne."""
+        delay = 0.05
+        while not self.closed:
+            if self.member_at(addr) in self.links:
+                # déjà relié (lien ouvert par l'autre côté) : on surveille seulement
+                await asyncio.sleep(1.0)
+                continue
+            try:
+                reader, writer = await open_link(addr)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            delay = 0.05
+            await self.run_link(reader, writer, dialed=True)
+            if not self.closed:
+                await asyncio.sleep(delay)
+
+    async def accept(self, reader, writer):
+        await self.run_link(reader, writer)
+
+    def keep_link(self, peer, dialed):
+        """Deux liens vers le même Master (ils se sont joints en même temps) :
+        les deux côtés gardent celui ouvert par le plus petit nom."""
+        if peer not in self.links:
+            return True
+        return dialed == (self.name < peer)
+
+    async def run_link(self, reader, writer, dialed=False):
+        conn = StreamConnection(reader, writer)
+        out = PeerSender(writer, LINK_HIGH_WATER, LINK_LOW_WATER, BLOCK,
+                         on_full=self.master.congested.add).start()
+        peer = None
+        try:
+            out.send(framing.HELLO, self.name)
+            frames = conn.frames()
+            ftype, data = await frames.__anext__()
+            if ftype != framing.HELLO:
+                return
+            name = data.decode('utf-8')
+            if name == self.name or not self.keep_link(name, dialed):
+                return
+            peer = name
+            previous = self.links.get(peer)
+            self.links[peer] = out
+            if previous is not None:
+                previous.writer.close()
+            self.log(f"🔗 Lien avec {peer}")
+            # État initial : membres connus et tout ce qui est servi ici
+            out.send(framing.MASTERS, self.format_members())
+            for name in self.master.local_names():
+                out.send(framing.OWN, self.master.ownership(name))
+
+            async for ftype, data in frames:
+                self.handle_frame(peer, ftype, data)
+                if self.master.congested:
+                    full = list(self.master.congested)
+                    self.master.congested.clear()
+                    await asyncio.gather(*(p.wait_writable() for p in full))
+        except (StopAsyncIteration, ConnectionError, OSError):
+            pass
+        except Exception as e:
+            self.log(f"❌ Lien {peer}: {e}", WARNING)
+        finally:
+            out.close()
+            conn.close()
+            if peer is not None and self.links.get(peer) is out:
+                del self.links[peer]
+                self.peer_lost(peer)
+
+    def handle_frame(self, peer, ftype, data):
+        handler = self.handlers.get(ftype)
+        if handler:
+            handler(peer, data)
+
+    def on_relay(self, peer, data):
+        name, inner_type, payload = decode_relay(data)
+        # Client parti entre-temps ou file pleine : il retrouvera le message dans sa boîte
+        if not self.master.deliver_or_store(name, inner_type, payload, relay=False):
+            self.log(f"⚠️ RELAY pour {name} qui n'est plus ici", WARNING)
+
+    def on_own(self, peer, data):
+        info = data.decode('utf-8')
+        name = info.partition("|")[0]
+        self.owners[name] = peer
+        self.master.remote_joined(name, info, peer)
+
+    def on_gone(self, peer, data):
+        name = data.decode('utf-8')
+        if self.owners.get(name) == peer:
+            del self.owners[name]
+            self.master.remote_left(name, peer)
+
+    def format_members(self):
+        return "|".join(f"{name}={addr}" for name, addr in self.members.items())
+
+    def merge_members(self, data):
+        """Gossip : ajoute les Masters inconnus, les joint, et propage s'il y a du nouveau."""
+        changed = False
+        for info in data.split("|"):
+            name, sep, addr = info.partition("=")
+            if not sep or name == self.name or self.members.get(name) == addr:
+                continue
+            self.members[name] = addr
+            self.dial_to(addr)
+            changed = True
+        if changed:
+            self.broadcast(framing.MASTERS, self.format_members())
+
+    def peer_lost(self, peer):
+        self.log(f"🔌 Lien perdu avec {peer}", WARNING)
+        for name in [n for n, owner in self.owners.items() if owner == peer]:
+            del self.owners[name]
+            self.master.remote_left(name, peer)
+
+    def owner(self, name):
+        return self.owners.get(name)
+
+    def announce(self, name):
+        """name vient de se connecter ici."""
+        self.owners.pop(name, None)
+        self.broadcast(framing.OWN, self.master.ownership(name))
+
+    def forget(self, name):
+        self.broadcast(framing.GONE, name)
+
+    def broadcast(self, ftype, payload):
+        for out in list(self.links.values()):
+            out.send(ftype, payload)
+
+    def relay(self, name, ftype, payload):
+        """Envoie la trame au Master qui sert name. False s'il est inconnu."""
+        out = self.links.get(self.owners.get(name))
+        if out is None:
+            return False
+        return out.send(framing.RELAY, relay_parts(name, ftype, payload))
+
+    def close(self):
+        self.closed = True
+        for task in self.tasks:
+            task.cancel()
+        for out in list(self.links.values()):
+            out.close()
+        if self.server:
+            self.server.close()
+        if self.listen and self.listen.startswith("unix:"):
+            try:
+                os.unlink(self.listen[5:])
+            except OSError:
+                pass
@@ -0,0 +1,121 @@
+"""Compression des messages, négociée au HELLO et appliquée une seule fois.
+
+Le client annonce ce qu'il sait compresser ("Client_A|lz4,zlib"), le Master
+répond dans son premier KEYS par l'algorithme retenu ("...|~zlib"). Le
+client compresse alors le texte une fois, avant les couches : chaque
+routeur déchiffre et relaie un corps plus court. Seul le Master le
+décompresse, à la livraison finale ; les destinataires reçoivent un FROM
+ordinaire.
+
+Texte compressé : MARKER | id de l'algorithme (1 octet) | données. MARKER
+(0xFF) n'apparaît jamais dans un texte UTF-8, un message non compressé
+n'est donc jamais pris pour un message compressé.
+"""
+import zlib
+from time import thread_time
+
+from onion.framing import MAX_FRAME
+
+MARKER = b"\xff"
+THRESHOLD = 512  # en dessous, le gain ne paie pas l'en-tête ni le CPU
+ZLIB_LEVEL = 1  # le plus rapide : chaque message n'est compressé qu'une fois mais sur le chemin critique
+
+
+def lz4_frame():
+    """Module lz4.frame s'il est installé, None sinon."""
+    try:
+        import lz4.frame
+    except ImportError:
+        return None
+    return lz4.frame
+
+
+def zlib_compress(data):
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def zlib_decompress(data, max_size):
+    d = zlib.decompressobj()
+    out = d.decompress(data, max_size)
+    if d.unconsumed_tail:
+        raise ValueError(f"texte décompressé trop grand (> {max_size} octets)")
+    return out
+
+
+def lz4_compress(data):
+    return lz4_frame().compress(data)
+
+
+def lz4_decompress(data, max_size):
+    module = lz4_frame()
+    if module is None:
+        raise ValueError("texte compressé en lz4, non installé ici")
+    d = module.LZ4FrameDecompressor()
+    out = d.decompress(data, max_length=max_size)
+    if not d.eof:
+        raise ValueError(f"texte décompressé trop grand (> {max_size} octets)")
+    return out
+
+
+# nom → (id, compression, décompression), par ordre de préférence
+CODECS = {
+    "lz4": (b"4", lz4_compress, lz4_decompress),
+    "zlib": (b"z", zlib_compress, zlib_decompress),
+}
+BY_ID = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+
+
+def available():
+    """Algorithmes utilisables ici, du préféré au moins bon."""
+    return [name for name in CODECS if name != "lz4" or lz4_frame() is not None]
+
+
+def negotiate(offered):
+    """Premier algorithme proposé par le client et connu ici, None sinon."""
+    usable = available()
+    for name in offered:
+        if name in usable:
+            return name
+    return None
+
+
+def unpack(data, max_size=MAX_FRAME):
+    """Texte reçu (bytes ou memoryview) → texte en clair ; inchangé s'il n'est pas compressé."""
+    if data[:1] != MARKER:
+        return data
+    name = BY_ID.get(bytes(data[1:2]))
+    if name is None:
+        raise ValueError(f"compression inconnue: {bytes(data[1:2])!r}")
+    try:
+        return CODECS[name][2](data[2:], max_size)
+    except ValueError:
+        raise
+    except Exception as e:  # zlib.error, RuntimeError de lz4 : données corrompues
+        raise ValueError(f"texte {name} illisible: {e}") from None
+
+
+class Compressor:
+    """Côté client : compresse les textes d'au moins threshold octets quand c'est rentable.
+
+    raw_bytes / sent_bytes / cpu_seconds cumulent tailles avant et après, et le
+    CPU passé à compresser (pour le banc de charge).
+    """
+
+    def __init__(self, codec, threshold=THRESHOLD):
+        self.codec = codec
+        self.threshold = threshold
+        self.codec_id, self.compress, _ = CODECS[codec]
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def pack(self, data):
+        self.raw_bytes += len(data)
+        if len(data) >= self.threshold:
+            start = thread_time()
+            packed = self.compress(data)
+            self.cpu_seconds += thread_time() - start
+            if len(packed) + 2 < len(data):
+                data = MARKER + self.codec_id + packed
+        self.sent_bytes += len(data)
+        return data
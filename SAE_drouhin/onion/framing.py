@@ -0,0 +1,271 @@
+"""Protocole de trames binaires partagé par le Master, les routeurs et les clients.
+
+Une trame = longueur du payload (4 octets, big-endian) | type (1 octet) | payload.
+TCP ne conserve pas les frontières de messages : un recv() peut contenir
+plusieurs trames ou un morceau seulement, d'où le décodeur incrémental.
+
+Les noms en clair en tête de payload (routeur d'entrée, saut suivant,
+destinataire, expéditeur) sont préfixés de leur longueur sur un octet
+(name_header / split_named) : lus en temps constant, sans chercher de
+séparateur ni découper le texte. Chaque nœud aiguille les trames par une
+table type → handler (Dispatcher) : un accès dict par trame, quel que soit
+le nombre de types.
+"""
+import socket
+import struct
+import threading
+
+HEADER = struct.Struct("!IB")
+MAX_FRAME = 16 * 1024 * 1024  # 16 Mo, au-delà on considère le flux corrompu
+RECV_SIZE = 65536
+
+# Types de trames (remplacent les préfixes texte "HELLO:", "KEYS:", ...)
+HELLO = 1    # <nom>
+KEYS = 2     # R1:123|R2:456|R3:789
+PRIVKEY = 3  # 123@5|456@4 (clés valides par époque, la courante en premier)
+ONION = 4    # <nom: entrée><onion chiffré> (client → Master)
+NEXT = 5     # <couche chiffrée> (Master → routeur)
+HOP = 6      # <nom: prochain saut><payload> ; saut vide = livraison finale <nom: dest><texte> (routeur → Master)
+FROM = 7     # <nom: expéditeur><texte> (Master → client)
+PEERS = 8    # R1=ip:port|R2=ip:port (Master → routeurs, annuaire des liens directs)
+CREATE = 9   # <id circuit><onion de création> (voir onion/circuit.py)
+CELL = 10    # <id circuit><corps chiffré>
+DESTROY = 11  # <id circuit>
+OWN = 12     # <nom>[|<clé>|<hôte>:<port>] (entre Masters, voir onion/cluster.py)
+GONE = 13    # <nom> (entre Masters)
+RELAY = 14   # <nom: pair><type><payload> (entre Masters : trame pour un pair servi ailleurs)
+MASTERS = 15  # <nom>=<adresse>|... (entre Masters : membres connus)
+DATA = 16    # <id circuit><corps chiffré> (morceau de flux, voir onion/stream.py)
+CHUNK = 17   # <nom: dest><morceau> (routeur de sortie → Master), <morceau> (Master → client)
+WINDOW = 18  # <nom: expéditeur><id flux><crédit> (client → Master), <id flux><crédit> (Master → client)
+REKEY = 19   # R1:123@5|... (Master → clients : seulement les clés qui ont changé)
+PING = 20    # <instant d'envoi 8 o><délai d'inactivité ms 4 o> (Master → clients et routeurs)
+PONG = 21    # payload du PING renvoyé tel quel (mesure du RTT)
+
+TYPE_NAMES = {
+    HELLO: "HELLO",
+    KEYS: "KEYS",
+    PRIVKEY: "PRIVKEY",
+    ONION: "ONION",
+    NEXT: "NEXT",
+    HOP: "HOP",
+    FROM: "FROM",
+    PEERS: "PEERS",
+    CREATE: "CREATE",
+    CELL: "CELL",
+    DESTROY: "DESTROY",
+    OWN: "OWN",
+    GONE: "GONE",
+    RELAY: "RELAY",
+    MASTERS: "MASTERS",
+    DATA: "DATA",
+    CHUNK: "CHUNK",
+    WINDOW: "WINDOW",
+    REKEY: "REKEY",
+    PING: "PING",
+    PONG: "PONG",
+}
+
+HEARTBEAT = struct.Struct("!dI")
+NAME = struct.Struct("!B")  # longueur du nom en tête de payload ("<nom: ...>" ci-dessus)
+FINAL = NAME.pack(0)  # HOP sans saut suivant : livraison finale
+MAX_NAME_HEADER = 260  # "TO:<nom>;MSG:" des couches chiffrées, cherché dans ces premiers octets
+
+
+class FrameError(Exception):
+    """Flux invalide (trame trop grande ou mal formée)."""
+
+
+def parse_address(addr):
+    """'127.0.0.1:9000' → ('127.0.0.1', 9000), ValueError si invalide."""
+    host, sep, port = addr.strip().rpartition(":")
+    if not sep or not host:
+        raise ValueError("Format Master invalide (ex: 127.0.0.1:9000)")
+    try:
+        return host, int(port)
+    except ValueError:
+        raise ValueError("Port Master invalide") from None
+
+
+def name_header(name):
+    """En-tête '<longueur 1 o><nom>' ; le payload qui suit n'est pas recopié."""
+    if isinstance(name, str):
+        name = name.encode('utf-8')
+    if len(name) > 255:
+        raise ValueError(f"nom trop long ({len(name)} octets)")
+    return NAME.pack(len(name)) + name
+
+
+def split_named(data):
+    """'<longueur 1 o><nom><reste>' → (nom en bytes, reste en memoryview), ValueError si tronqué."""
+    if not len(data):
+        raise ValueError("payload vide")
+    end = 1 + data[0]
+    if len(data) < end:
+        raise ValueError("nom tronqué")
+    view = memoryview(data)
+    return bytes(view[1:end]), view[end:]
+
+
+class Dispatcher(dict):
+    """Table type de trame → handler, remplie par register()."""
+
+    def register(self, handler, *ftypes):
+        for ftype in ftypes:
+            self[ftype] = handler
+        return handler
+
+
+def idle_timeout(ping):
+    """Délai d'inactivité annoncé par le Master dans un PING, en secondes (None = aucun)."""
+    _, ms = HEARTBEAT.unpack_from(ping)
+    return ms / 1000 or None
+
+
+def encode_frame(ftype, payload=b""):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    elif isinstance(payload, (tuple, list)):
+        payload = b"".join(payload)
+    return HEADER.pack(len(payload), ftype) + payload
+
+
+def frame_buffers(ftype, payload=b""):
+    """Trame sans recopie du payload : (taille totale, [en-tête, morceaux...]).
+
+    payload peut être un str, un objet bytes-like (memoryview comprise) ou
+    une liste/tuple de morceaux écrits à la suite (scatter/gather).
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    parts = list(payload) if isinstance(payload, (tuple, list)) else [payload]
+    length = 0
+    for part in parts:
+        length += len(part)
+    parts.insert(0, HEADER.pack(length, ftype))
+    return HEADER.size + length, parts
+
+
+class FrameDecoder:
+    """Décodeur incrémental : on lui donne des octets, il rend les trames complètes.
+
+    Avec views=True, les payloads sont des memoryview sur les octets reçus
+    (aucune copie par trame : quand une lecture ne contient que des trames
+    entières, elles pointent directement dans le bloc lu).
+    """
+
+    def __init__(self, max_size=MAX_FRAME, views=False):
+        self.max_size = max_size
+        self.views = views
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Ajoute data au tampon et renvoie la liste des trames (type, payload) complètes."""
+        if self.views and not self.buffer:
+            src = data  # rien en attente : on découpe directement le bloc lu
+        else:
+            self.buffer += data
+            src = self.buffer
+        spans = []
+        pos = 0
+        size = HEADER.size
+        while len(src) - pos >= size:
+            length, ftype = HEADER.unpack_from(src, pos)
+            if length > self.max_size:
+                raise FrameError(f"trame trop grande ({length} octets)")
+            end = pos + size + length
+            if end > len(src):
+                break
+            spans.append((ftype, pos + size, end))
+            pos = end
+
+        if not self.views:
+            frames = [(ftype, bytes(src[start:end])) for ftype, start, end in spans]
+        else:
+            # une seule copie figée du tampon (si besoin), puis des vues dessus
+            view = memoryview(data if src is data else bytes(src[:pos]))
+            frames = [(ftype, view[start:end]) for ftype, start, end in spans]
+        if src is data:
+            if pos < len(data):
+                self.buffer += data[pos:]
+        elif pos:
+            del self.buffer[:pos]
+        return frames
+
+
+class FramedConnection:
+    """Socket TCP qui envoie et reçoit des trames.
+
+    Plusieurs threads peuvent écrire sur la même connexion (le Master relaie
+    vers un routeur depuis le thread de chaque client), le verrou garantit
+    qu'une trame part en entier avant la suivante.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.decoder = FrameDecoder()
+
+    def send(self, ftype, payload=b""):
+        data = encode_frame(ftype, payload)
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def settimeout(self, timeout):
+        """Plus rien reçu pendant timeout secondes : la lecture lève TimeoutError."""
+        self.sock.settimeout(timeout)
+
+    def send_batch(self, frames):
+        """Plusieurs trames [(type, payload)] en un seul sendall."""
+        data = b"".join(encode_frame(ftype, payload) for ftype, payload in frames)
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def frames(self):
+        """Itère sur les trames reçues jusqu'à la fermeture du socket."""
+        while True:
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                return
+            for frame in self.decoder.feed(data):
+                yield frame
+
+    def close(self):
+        # shutdown d'abord : le pair reçoit la fin de connexion tout de suite et
+        # un recv() bloqué dans un autre thread (frames()) se réveille
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # déjà coupé par le pair
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class StreamConnection:
+    """Équivalent asyncio de FramedConnection (StreamReader/StreamWriter).
+
+    send() ne bloque jamais : la trame part dans le tampon du transport,
+    la boucle d'événements l'écrit quand le socket est prêt.
+    """
+
+    def __init__(self, reader, writer, views=False):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = FrameDecoder(views=views)
+
+    def send(self, ftype, payload=b""):
+        self.writer.write(encode_frame(ftype, payload))
+
+    async def frames(self):
+        """Itère (async for) sur les trames reçues jusqu'à la fermeture."""
+        while True:
+            data = await self.reader.read(RECV_SIZE)
+            if not data:
+                return
+            for frame in self.decoder.feed(data):
+                yield frame
+
+    def close(self):
+        self.writer.close()
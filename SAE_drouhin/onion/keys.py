@@ -0,0 +1,199 @@
+"""Clés des routeurs par époque : cache du Master, rotation avec recouvrement.
+
+Chaque clé porte une époque (entier croissant par routeur). Chaque couche
+chiffrée commence par l'époque de sa clé, en clair sur un octet :
+
+    <époque % 256><couche chiffrée>
+
+Le routeur garde sa clé courante et les précédentes encore en recouvrement
+(PRIVKEY "123@5|456@4", la courante en premier, suivie de "|+<suite>" si
+le Master n'utilise pas le XOR historique) et déchiffre chaque couche
+avec la clé de son époque : un onion construit juste avant une rotation
+passe encore, un onion d'une époque oubliée est refusé clairement au lieu
+de donner du texte illisible.
+
+Les clés sont des entiers écrits en décimal partout (KEYS, PRIVKEY, base).
+Le XOR historique n'en utilise qu'un octet et garde ses clés à 5 chiffres ;
+pour les autres suites, une clé vient de secrets et porte KEY_BITS bits
+aléatoires (39 chiffres : colonne routers.key_value en VARCHAR(40)).
+
+Côté Master, KeyCache garde les clés de tous les routeurs, les charge de la
+base en une seule requête au premier besoin, les fait tourner toutes les
+rotate_every secondes et oublie les anciennes après overlap secondes.
+version augmente à chaque changement : changed_since(v) donne les routeurs
+dont la clé a changé, poussés aux clients en une trame REKEY (seulement
+eux, sans reconstruire les circuits).
+"""
+import random
+import secrets
+import threading
+import time
+
+from onion import cipher
+
+ROTATE_EVERY = 3600.0
+OVERLAP = 60.0
+KEY_BITS = 128
+
+
+def new_key(suite=cipher.DEFAULT_SUITE):
+    if suite == cipher.DEFAULT_SUITE:
+        return random.randint(10000, 99999)
+    # Bit de tête forcé : KEY_BITS bits aléatoires, longueur décimale stable
+    return secrets.randbits(KEY_BITS) | 1 << KEY_BITS
+
+
+def strong_enough(key, suite=cipher.DEFAULT_SUITE):
+    """False pour une clé trop courte pour suite (ancienne clé XOR en base)."""
+    return suite == cipher.DEFAULT_SUITE or key.bit_length() > KEY_BITS
+
+
+def format_key(entry):
+    """(époque, clé) → '123@5'."""
+    epoch, key = entry
+    return f"{key}@{epoch}"
+
+
+def parse_key(text):
+    """'123@5' → (5, 123) ; '123' (sans époque) → (0, 123)."""
+    key, _, epoch = text.partition("@")
+    return int(epoch or 0), int(key)
+
+
+def format_keyring(entries, suite=cipher.DEFAULT_SUITE):
+    text = "|".join(format_key(e) for e in entries)
+    return text if suite == cipher.DEFAULT_SUITE else f"{text}|+{suite}"
+
+
+def parse_keyring(text):
+    """PRIVKEY → {époque % 256: clé}, l'entrée courante (la première) et le nom de la suite."""
+    parts = [part for part in text.split("|") if part]
+    suites = [part[1:] for part in parts if part.startswith("+")]
+    entries = [parse_key(part) for part in parts if not part.startswith("+")]
+    return {epoch & 0xFF: key for epoch, key in entries}, entries[0], suites[0] if suites else cipher.DEFAULT_SUITE
+
+
+def seal(data, entry, suite=None):
+    """Chiffre une couche avec la clé (époque, clé) et la préfixe de son époque.
+
+    suite : onion.cipher.SUITES[...], le XOR historique par défaut.
+    """
+    epoch, key = entry
+    return bytes((epoch & 0xFF,)) + (suite or cipher.SUITES[cipher.DEFAULT_SUITE]).encrypt(data, key)
+
+
+def seal_batch(items, entry, suite=None):
+    """seal() de plusieurs couches pour la même clé, en un appel à la suite."""
+    epoch, key = entry
+    prefix = bytes((epoch & 0xFF,))
+    sealed = (suite or cipher.SUITES[cipher.DEFAULT_SUITE]).encrypt_batch([(data, key) for data in items])
+    return [prefix + data for data in sealed]
+
+
+class KeyCache:
+    """Cache versionné des clés du Master : nom → [(époque, clé, fin de validité)].
+
+    La première entrée est la courante (fin de validité None), les suivantes
+    sont les anciennes encore acceptées par le routeur.
+    """
+
+    def __init__(self, loader=None, rotate_every=ROTATE_EVERY, overlap=OVERLAP, suite=cipher.DEFAULT_SUITE):
+        self.loader = loader  # () → [(nom, clé)] depuis la base, appelé une fois
+        self.suite = suite  # nom de la suite : taille des clés émises
+        self.loaded = loader is None
+        self.load_lock = threading.Lock()
+        self.rotate_every = rotate_every
+        self.overlap = overlap
+        self.entries = {}
+        self.issued = {}  # nom → instant de la clé courante (rotation)
+        self.changed = {}  # nom → version de son dernier changement
+        self.version = 0
+
+    def load(self):
+        """Chargement en bloc depuis la base, une seule fois (bloquant : hors de la boucle)."""
+        with self.load_lock:
+            if self.loaded:
+                return
+            rows = self.loader()
+            self.loaded = True
+            now = time.monotonic()
+            for name, key in rows:
+                # Une clé trop courte pour la suite est remplacée au HELLO du routeur
+                if name not in self.entries and strong_enough(int(key), self.suite):
+                    self.entries[name] = [(0, int(key), None)]
+                    self.issued[name] = now
+                    self.touch(name)
+
+    def touch(self, name):
+        self.version += 1
+        self.changed[name] = self.version
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        """Clé courante (époque, clé)."""
+        epoch, key, _ = self.entries[name][0]
+        return epoch, key
+
+    def get(self, name):
+        return self[name] if name in self.entries else None
+
+    def keyring(self, name):
+        """Clés encore valides, la courante en premier : [(époque, clé)]."""
+        return [(epoch, key) for epoch, key, _ in self.entries[name]]
+
+    def issue(self, name):
+        """Renvoie ((époque, clé), créée) ; une clé existante n'est pas remplacée."""
+        if name in self.entries:
+            return self[name], False
+        self.entries[name] = [(0, new_key(self.suite), None)]
+        self.issued[name] = time.monotonic()
+        self.touch(name)
+        return self[name], True
+
+    def put(self, name, entry):
+        """Clé apprise d'un autre Master (OWN). True si elle a changé."""
+        if self.get(name) == entry:
+            return False
+        epoch, key = entry
+        self.entries[name] = [(epoch, key, None)]
+        self.issued[name] = time.monotonic()
+        self.touch(name)
+        return True
+
+    def rotate(self, name, now=None):
+        """Nouvelle clé courante ; l'ancienne reste valide overlap secondes."""
+        now = time.monotonic() if now is None else now
+        epoch, key, _ = self.entries[name][0]
+        fresh = new_key(self.suite)
+        while fresh == key:
+            fresh = new_key(self.suite)
+        old = [(e, k, until) for e, k, until in self.entries[name][1:] if until > now]
+        self.entries[name] = [(epoch + 1, fresh, None), (epoch, key, now + self.overlap)] + old
+        self.issued[name] = now
+        self.touch(name)
+        return self[name]
+
+    def due(self, names, now=None):
+        """Parmi names, ceux dont la clé courante doit tourner."""
+        if not self.rotate_every:
+            return []
+        now = time.monotonic() if now is None else now
+        return [n for n in names if n in self.entries and now - self.issued[n] >= self.rotate_every]
+
+    def expire(self, now=None):
+        """Oublie les anciennes clés hors recouvrement ; renvoie les routeurs concernés."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        for name, entries in self.entries.items():
+            if len(entries) > 1 and any(until <= now for _, _, until in entries[1:]):
+                entries[1:] = [e for e in entries[1:] if e[2] > now]
+                expired.append(name)
+        return expired
+
+    def changed_since(self, version):
+        return [name for name, v in self.changed.items() if v > version]
+
+    def __repr__(self):
+        return repr({name: format_key(self[name]) for name in self.entries})
@@ -0,0 +1,102 @@
+"""Couches de l'onion (mode sans circuit) : format binaire versionné.
+
+Couche déchiffrée, version 2 :
+
+    <version 1 o><saut suivant 4 o><longueur du corps 4 o><corps>
+
+Le saut suivant est le numéro du routeur (R2 → 2), EXIT pour le dernier
+routeur ; son corps est alors "<nom: destination><texte>" (voir
+framing.name_header), remis tel quel au Master dans le HOP final. Le
+routeur ne lit que l'en-tête de taille fixe et transmet la tranche du
+corps sans la parcourir : un '|' ou un ';MSG:' dans le texte ne peut plus
+tromper le découpage. Les octets au-delà de la longueur annoncée sont
+ignorés (bourrage possible).
+
+Version 1 : l'ancien texte "NEXT:<saut>|<corps>", corps final
+"TO:<destination>;MSG:<texte>". Les routeurs lisent toujours les deux (le
+premier octet, 2 ou 'N', les distingue) : clients et Masters passent à la
+version 2 quand tous les routeurs sont à jour (--layer-version).
+"""
+import struct
+
+from onion import framing
+from onion.keys import seal
+from onion.registry import is_router_name, router_index
+
+V1 = 1
+V2 = 2
+VERSIONS = (V1, V2)
+LAYER = struct.Struct("!BII")
+EXIT = 0xFFFFFFFF  # pas de saut suivant : livraison finale
+V2_BYTE = bytes((V2,))
+
+
+def hop_id(name):
+    """'R2' → 2, ValueError si ce n'est pas un nom de routeur."""
+    if not is_router_name(name) or router_index(name) >= EXIT:
+        raise ValueError(f"saut invalide: {name!r}")
+    return router_index(name)
+
+
+def pack_layer(next_hop, body, version=V2):
+    """Couche en clair pour le routeur qui transmet à next_hop ('' : dernier routeur)."""
+    if version == V1:
+        return b"NEXT:" + next_hop.encode('utf-8') + b"|" + body
+    return LAYER.pack(V2, hop_id(next_hop) if next_hop else EXIT, len(body)) + body
+
+
+def pack_exit(dest, text, version=V2):
+    """Corps de la couche de sortie : destination et texte."""
+    if version == V1:
+        return f"TO:{dest};MSG:".encode('utf-8') + text
+    return framing.name_header(dest) + text
+
+
+def build_onion(hops, keys, dest, text, version=V2, suite=None):
+    """Onion pour hops (sans l'entrée '*' éventuelle) ; keys : nom → (époque, clé).
+
+    Sans saut (chemin "*"), la couche de sortie part en clair : le Master la
+    chiffre pour le routeur d'entrée qu'il choisit.
+    """
+    current = pack_exit(dest, text, version)
+    if not hops:
+        # version 1 : le Master ajoute lui-même "NEXT:|"
+        return current if version == V1 else pack_layer("", current, version)
+    next_hop = ""
+    for router in reversed(hops):
+        current = seal(pack_layer(next_hop, current, version), keys[router], suite)
+        next_hop = router
+    return current
+
+
+def unpack_layer(plain):
+    """Couche déchiffrée → (saut suivant 'R2' ou '' à la sortie, corps).
+
+    À la sortie, le corps est "<nom: destination><texte>" quelle que soit la
+    version. ValueError si la couche est mal formée.
+    """
+    if plain[:1] == V2_BYTE:
+        if len(plain) < LAYER.size:
+            raise ValueError("couche tronquée")
+        _, hop, length = LAYER.unpack_from(plain)
+        if len(plain) < LAYER.size + length:
+            raise ValueError(f"corps tronqué ({len(plain) - LAYER.size}/{length} octets)")
+        body = memoryview(plain)[LAYER.size:LAYER.size + length]
+        return ("" if hop == EXIT else f"R{hop}"), body
+    if plain[:5] == b"NEXT:":
+        return unpack_text(plain)
+    raise ValueError(f"version de couche inconnue ({bytes(plain[:1])!r})")
+
+
+def unpack_text(plain):
+    """Version 1 : "NEXT:<saut>|<corps>", corps final "TO:<dest>;MSG:<texte>"."""
+    sep = plain.find(b"|", 0, framing.MAX_NAME_HEADER)
+    if sep < 0:
+        raise ValueError("format inattendu (pas 'NEXT:xxx|yyy')")
+    next_hop = bytes(plain[5:sep]).decode('utf-8')
+    if next_hop:
+        return next_hop, memoryview(plain)[sep + 1:]
+    end = plain.find(b";MSG:", sep, sep + framing.MAX_NAME_HEADER)
+    if plain[sep + 1:sep + 4] != b"TO:" or end < 0:
+        raise ValueError("format inattendu (pas 'TO:xxx;MSG:yyy')")
+    return "", framing.name_header(plain[sep + 4:end]) + memoryview(plain)[end + 5:]
@@ -0,0 +1,121 @@
+"""Journal des nœuds : anneau en mémoire + vidage périodique par lots.
+
+Les threads réseau ne touchent jamais l'affichage : Logger.log() ajoute une
+entrée dans un anneau borné (deque.append est atomique, pas de verrou) et
+un consommateur (timer Qt de la fenêtre, ou thread console en mode sans
+interface) vide l'anneau par lots.
+
+Sur le chemin de chaque message, le coût doit être quasi nul quand le
+niveau DEBUG est coupé :
+
+    if self.logger.enabled(DEBUG):
+        self.log(f"📨 Reçu ... {repr(data)[:80]}", DEBUG, "trafic")
+"""
+import atexit
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+
+class LogRing:
+    """Anneau borné : une fois plein, les entrées les plus anciennes sont écrasées."""
+
+    def __init__(self, capacity=10000):
+        self.entries = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def append(self, entry):
+        if len(self.entries) == self.entries.maxlen:
+            self.dropped += 1  # approximatif en concurrence, suffisant pour un compteur
+        self.entries.append(entry)
+
+    def drain(self, limit=None):
+        """Retire et renvoie jusqu'à limit entrées (toutes par défaut)."""
+        out = []
+        pop = self.entries.popleft
+        try:
+            while limit is None or len(out) < limit:
+                out.append(pop())
+        except IndexError:
+            pass
+        return out
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def format_entry(entry):
+    ts, level, category, msg = entry
+    return f"[{datetime.fromtimestamp(ts).strftime('%H:%M:%S')}] {msg}"
+
+
+class Logger:
+    def __init__(self, level=INFO, capacity=10000):
+        self.level = level
+        self.ring = LogRing(capacity)
+        self.sampling = {}  # catégorie → on garde 1 entrée sur N
+        self.counters = {}
+        self.flusher = None
+
+    def set_level(self, level):
+        self.level = LEVELS[level] if isinstance(level, str) else level
+
+    def set_sampling(self, category, every):
+        """Ne garde qu'une entrée sur every pour cette catégorie (1 = toutes)."""
+        if every <= 1:
+            self.sampling.pop(category, None)
+        else:
+            self.sampling[category] = every
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, msg, level=INFO, category="general"):
+        if level < self.level:
+            return
+        every = self.sampling.get(category)
+        if every:
+            n = self.counters.get(category, 0) + 1
+            self.counters[category] = n
+            if n % every:
+                return
+        self.ring.append((time.time(), level, category, msg))
+
+    def to_console(self, interval=0.2, stream=None):
+        """Vide l'anneau vers la console depuis un thread dédié (mode sans interface)."""
+        if self.flusher is None:
+            self.flusher = ConsoleFlusher(self, interval, stream).start()
+            atexit.register(self.flusher.flush)
+        return self
+
+
+class ConsoleFlusher:
+    def __init__(self, logger, interval=0.2, stream=None):
+        self.logger = logger
+        self.interval = interval
+        self.stream = stream
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        batch = self.logger.ring.drain()
+        if batch:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(format_entry(e) for e in batch) + "\n")
+            stream.flush()
@@ -0,0 +1,308 @@
+"""Courrier en attente (store-and-forward) pour les clients hors ligne.
+
+Un message final pour un client qui n'est connecté à aucun Master n'est
+plus perdu : le Master le garde dans la boîte du destinataire et le livre
+dès son HELLO, par lots.
+
+Chaque boîte est bornée : memory_bytes en mémoire, puis le surplus part
+sur disque (un fichier par destinataire, enregistrements ajoutés à la
+suite), jusqu'à max_bytes au total ; au-delà le message est refusé. Un
+message plus vieux que ttl secondes est oublié.
+
+Enregistrement sur disque :
+
+    <instant de dépôt 8 o><longueur 4 o><type de trame 1 o><payload>
+
+Les instants sont des time.time() : avec un dossier fixe (--mailbox-dir),
+les boîtes sont écrites sur disque à l'arrêt et relues au démarrage. Sans
+dossier, un dossier temporaire est créé au premier débordement et
+supprimé à l'arrêt.
+"""
+import os
+import shutil
+import struct
+import tempfile
+import time
+from collections import deque
+from urllib.parse import quote, unquote
+
+RECORD = struct.Struct("!dIB")
+MEMORY_BYTES = 256 * 1024  # par destinataire, au-delà : disque
+MAX_BYTES = 16 * 1024 * 1024  # par destinataire, mémoire + disque
+TTL = 24 * 3600.0
+MAX_DESTINATIONS = 10000  # boîtes ouvertes en même temps (noms inventés par un expéditeur)
+SUFFIX = ".box"
+
+
+def join_payload(payload):
+    """Payload de trame (bytes, memoryview ou morceaux) → bytes, détaché du bloc reçu."""
+    if isinstance(payload, (tuple, list)):
+        return b"".join(payload)
+    return bytes(payload)
+
+
+class Box:
+    """Boîte d'un destinataire : les plus anciens en mémoire, le surplus sur disque."""
+
+    def __init__(self):
+        self.memory = deque()  # (instant, type, payload)
+        self.memory_bytes = 0
+        self.disk = deque()  # (instant, taille) des enregistrements encore valides du fichier
+        self.disk_bytes = 0
+        self.skip = 0  # enregistrements périmés en tête du fichier, sautés à la relecture
+
+    def __len__(self):
+        return len(self.memory) + len(self.disk)
+
+    def oldest(self):
+        if self.memory:
+            return self.memory[0][0]
+        return self.disk[0][0] if self.disk else None
+
+
+class Mailbox:
+    """Boîtes de tous les destinataires absents d'un Master.
+
+    queued / delivered / expired / dropped cumulent les messages pour les
+    métriques ; memory_bytes / disk_bytes sont les octets en attente.
+    """
+
+    def __init__(self, directory=None, ttl=TTL, memory_bytes=MEMORY_BYTES, max_bytes=MAX_BYTES,
+                 max_destinations=MAX_DESTINATIONS, log=print):
+        self.directory = directory
+        self.temporary = directory is None
+        self.ttl = ttl
+        self.memory_limit = memory_bytes
+        self.max_bytes = max_bytes
+        self.max_destinations = max_destinations
+        self.log = log
+        self.boxes = {}  # nom → Box
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        # Statistiques
+        self.queued = 0
+        self.delivered = 0
+        self.expired = 0
+        self.dropped = 0
+        if directory:
+            self.recover()
+
+    def pending(self, name):
+        return name in self.boxes
+
+    def __len__(self):
+        return sum(len(box) for box in self.boxes.values())
+
+    def path(self, name):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="onion-mailbox-")
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, quote(name, safe="") + SUFFIX)
+
+    def put(self, name, ftype, payload, now=None):
+        """Garde la trame pour name. False si sa boîte (ou le nombre de boîtes) est plein."""
+        now = time.time() if now is None else now
+        box = self.boxes.get(name)
+        if box is None:
+            if len(self.boxes) >= self.max_destinations:
+                self.dropped += 1
+                return False
+            box = self.boxes[name] = Box()
+        data = join_payload(payload)
+        size = len(data)
+        if box.memory_bytes + box.disk_bytes + size > self.max_bytes:
+            self.dropped += 1
+            if not box:
+                del self.boxes[name]
+            return False
+        # Dès qu'il y a du disque, tout ce qui suit y va aussi : l'ordre est gardé
+        if box.disk or box.memory_bytes + size > self.memory_limit:
+            try:
+                with open(self.path(name), "ab") as f:
+                    f.write(RECORD.pack(now, size, ftype))
+                    f.write(data)
+            except OSError as e:
+                self.log(f"❌ Boîte de {name}: écriture impossible ({e})")
+                self.dropped += 1
+                if not box:
+                    del self.boxes[name]
+                return False
+            box.disk.append((now, size))
+            box.disk_bytes += size
+            self.disk_bytes += size
+        else:
+            box.memory.append((now, ftype, data))
+            box.memory_bytes += size
+            self.memory_bytes += size
+        self.queued += 1
+        return True
+
+    def take(self, name, budget=None, now=None):
+        """Retire les plus anciens messages de name, jusqu'à budget octets (au moins
+        un si budget > 0, aucun sinon).
+
+        Renvoie [(âge en secondes, type, payload)] ; la boîte disparaît une fois vide.
+        """
+        box = self.boxes.get(name)
+        if box is None or (budget is not None and budget <= 0):
+            return []
+        now = time.time() if now is None else now
+        if not box.memory and box.disk:
+            self.load(name, box)
+        batch = []
+        size = 0
+        while box.memory and (budget is None or not batch or size + len(box.memory[0][2]) <= budget):
+            stamp, ftype, data = box.memory.popleft()
+            box.memory_bytes -= len(data)
+            self.memory_bytes -= len(data)
+            if now - stamp > self.ttl:
+                self.expired += 1
+                continue
+            batch.append((now - stamp, ftype, data))
+            size += len(data)
+        self.delivered += len(batch)
+        if not box:
+            self.discard(name)
+        return batch
+
+    def restore(self, name, batch, now=None):
+        """Remet en tête de la boîte de name un lot de take() qui n'a pas pu partir."""
+        now = time.time() if now is None else now
+        box = self.boxes.get(name)
+        if box is None:
+            box = self.boxes[name] = Box()
+        for age, ftype, data in reversed(batch):
+            box.memory.appendleft((now - age, ftype, data))
+            box.memory_bytes += len(data)
+            self.memory_bytes += len(data)
+        self.delivered -= len(batch)
+
+    def load(self, name, box):
+        """Relit le fichier de name en mémoire (en un bloc) et le supprime."""
+        path = self.path(name)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except OSError as e:
+            self.log(f"❌ Boîte de {name}: lecture impossible ({e}), {len(box.disk)} messages perdus")
+            blob = b""
+        pos = 0
+        index = 0
+        while pos + RECORD.size <= len(blob):
+            stamp, size, ftype = RECORD.unpack_from(blob, pos)
+            pos += RECORD.size
+            if index >= box.skip:
+                data = blob[pos:pos + size]
+                box.memory.append((stamp, ftype, data))
+                box.memory_bytes += len(data)
+                self.memory_bytes += len(data)
+            pos += size
+            index += 1
+        self.disk_bytes -= box.disk_bytes
+        box.disk.clear()
+        box.disk_bytes = 0
+        box.skip = 0
+        self.remove_file(path)
+
+    def expire(self, now=None):
+        """Oublie les messages plus vieux que ttl. Renvoie le nombre de messages oubliés."""
+        now = time.time() if now is None else now
+        limit = now - self.ttl
+        count = 0
+        for name, box in list(self.boxes.items()):
+            while box.memory and box.memory[0][0] < limit:
+                _, _, data = box.memory.popleft()
+                box.memory_bytes -= len(data)
+                self.memory_bytes -= len(data)
+                count += 1
+            while not box.memory and box.disk and box.disk[0][0] < limit:
+                _, size = box.disk.popleft()
+                box.disk_bytes -= size
+                self.disk_bytes -= size
+                box.skip += 1
+                count += 1
+            if not box:
+                self.discard(name)
+        self.expired += count
+        return count
+
+    def discard(self, name):
+        box = self.boxes.pop(name)
+        self.memory_bytes -= box.memory_bytes
+        self.disk_bytes -= box.disk_bytes
+        if box.skip or box.disk:
+            self.remove_file(self.path(name))
+
+    def remove_file(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def recover(self):
+        """Au démarrage : index des boîtes laissées sur disque par le Master précédent."""
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(SUFFIX):
+                continue
+            name = unquote(filename[:-len(SUFFIX)])
+            box = Box()
+            try:
+                with open(os.path.join(self.directory, filename), "rb") as f:
+                    while True:
+                        head = f.read(RECORD.size)
+                        if len(head) < RECORD.size:
+                            break
+                        stamp, size, _ = RECORD.unpack(head)
+                        f.seek(size, os.SEEK_CUR)
+                        box.disk.append((stamp, size))
+                        box.disk_bytes += size
+            except OSError as e:
+                self.log(f"❌ Boîte de {name}: lecture impossible ({e})")
+                continue
+            if box:
+                self.boxes[name] = box
+                self.disk_bytes += box.disk_bytes
+        if self.boxes:
+            self.log(f"📪 {len(self)} messages en attente retrouvés pour {len(self.boxes)} clients")
+        self.expire()
+
+    def oldest_age(self, now=None):
+        stamps = [box.oldest() for box in self.boxes.values()]
+        if not stamps:
+            return 0.0
+        return (time.time() if now is None else now) - min(stamps)
+
+    def close(self):
+        """Arrêt du Master : le dossier temporaire disparaît ; dans un dossier fixe,
+        la partie en mémoire rejoint le disque pour le prochain démarrage."""
+        if self.temporary:
+            if self.directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            return
+        for name, box in self.boxes.items():
+            if box.memory:
+                self.save(name, box)
+
+    def save(self, name, box):
+        """Réécrit le fichier de name : la mémoire d'abord (plus ancienne), puis le disque."""
+        path = self.path(name)
+        try:
+            tail = b""
+            if box.disk:
+                with open(path, "rb") as f:
+                    tail = f.read()
+                pos = 0
+                for _ in range(box.skip):
+                    _, size, _ = RECORD.unpack_from(tail, pos)
+                    pos += RECORD.size + size
+                tail = tail[pos:]
+            with open(path + ".tmp", "wb") as f:
+                for stamp, ftype, data in box.memory:
+                    f.write(RECORD.pack(stamp, len(data), ftype))
+                    f.write(data)
+                f.write(tail)
+            os.replace(path + ".tmp", path)
+        except (OSError, struct.error) as e:
+            self.log(f"❌ Boîte de {name}: sauvegarde impossible ({e})")
@@ -0,0 +1,803 @@
+"""Moteur asyncio du Master : une coroutine par pair, aucun thread par connexion.
+
+La fenêtre PyQt (Master.py) n'est qu'un observateur optionnel : le moteur
+tourne aussi sans interface.
+"""
+import asyncio
+from time import perf_counter
+
+from onion import cipher, compress, framing, layer
+from onion.circuit import CIRC_ID
+from onion.cluster import Cluster
+from onion.framing import StreamConnection
+from onion.keys import OVERLAP, ROTATE_EVERY, KeyCache, format_key, format_keyring, parse_key, seal
+from onion.logbuf import DEBUG, ERROR, INFO, WARNING, Logger
+from onion.mailbox import MAX_BYTES, MEMORY_BYTES, TTL, Mailbox
+from onion.metrics import Metrics, MetricsServer
+from onion.persistence import ConnectionPool, WriteBehindStore
+from onion.pool import format_peers
+from onion.registry import LEAST_LOADED, RouterRegistry, is_router_name
+from onion.sendqueue import BLOCK, DROP, HIGH_WATER, LOW_WATER, PeerSender
+
+LISTEN_BACKLOG = 4096
+DB_POOL_SIZE = 2
+KEY_TICK = 1.0  # période de la vérification des rotations de clés
+ANNOUNCE_DELAY = 0.5  # nouvelle clé annoncée aux clients après le routeur (PRIVKEY arrivé avant)
+MAILBOX_TICK = 5.0  # période du ménage des messages en attente trop vieux
+HEARTBEAT_INTERVAL = 10.0  # PING vers chaque client et routeur
+IDLE_TIMEOUT = 30.0  # pair muet (ni trame ni PONG) depuis ce délai : déconnecté
+# Attente d'un message gardé pour un client hors ligne : de la seconde au jour
+MAILBOX_BUCKETS = (1, 5, 30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600)
+
+
+def raise_fd_limit():
+    """Monte la limite de descripteurs au maximum autorisé (10k+ pairs)."""
+    try:
+        import resource
+    except ImportError:  # Windows : pas de limite à ajuster
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+class MasterObserver:
+    """Observateur par défaut (sans interface) : rien à afficher en dehors des logs."""
+
+    def counts_changed(self, nb_clients, nb_routers):
+        pass
+
+
+class AsyncMaster:
+    def __init__(self, observer=None, logger=None, high_water=HIGH_WATER, low_water=LOW_WATER,
+                 client_policy=DROP, router_policy=BLOCK, entry_policy=LEAST_LOADED,
+                 metrics_port=None, metrics_host="127.0.0.1",
+                 cluster_name=None, cluster_listen=None, cluster_peers=(), cluster_advertise=None,
+                 key_rotation=ROTATE_EVERY, key_overlap=OVERLAP,
+                 mailbox_dir=None, mailbox_ttl=TTL, mailbox_memory=MEMORY_BYTES, mailbox_max=MAX_BYTES,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, idle_timeout=IDLE_TIMEOUT, layer_version=layer.V2,
+                 cipher_suite=cipher.DEFAULT_SUITE):
+        self.observer = observer or MasterObserver()
+        self.logger = logger or Logger().to_console()
+        # Files de sortie par pair : un client bloqué ne doit pas arrêter un routeur
+        # de sortie (drop), un routeur saturé freine ceux qui lui envoient (block)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.client_policy = client_policy
+        self.router_policy = router_policy
+        self.congested = set()  # files passées au-dessus du seuil haut (politique block)
+        self.clients = {}  # nom → PeerSender
+        # Clés chargées de la base au premier besoin, en une requête (fetch_keys)
+        keys = KeyCache(self.fetch_keys, key_rotation, key_overlap, cipher_suite)
+        self.registry = RouterRegistry(entry_policy, keys=keys)
+        self.routers = self.registry.live  # nom → PeerSender des routeurs connectés
+        self.router_addrs = {}  # adresse d'écoute des routeurs pour les liens directs
+        self.circuits = {}  # id brut → (routeur d'entrée, client, entrée choisie par le Master)
+        self.client_circuits = {}  # client → ids de ses circuits
+        self.layer_version = layer_version  # format de la couche ajoutée pour le routeur d'entrée choisi
+        self.suite = cipher.suite(cipher_suite)  # imposée à tous, annoncée dans PRIVKEY et KEYS
+        # Messages pour les clients hors ligne, livrés à leur HELLO (onion/mailbox.py)
+        self.mailbox = Mailbox(mailbox_dir, mailbox_ttl, mailbox_memory, mailbox_max,
+                               log=lambda msg: self.log(msg, WARNING, "mailbox"))
+        self.draining = set()  # clients dont le courrier en attente est en cours de livraison
+        # Battements de cœur : une connexion à moitié ouverte ne garde plus sa place
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.activity = {}  # nom → instant (perf_counter) de sa dernière trame
+        self.last_beat = perf_counter()
+        self.db = None  # pool MariaDB, initialisé au démarrage
+        self.store = None  # file d'écriture différée vers la base
+        self.loop = None
+        self.server = None
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_server = None
+        # Autres Masters (workers du même port ou fédération) : None pour un Master seul
+        self.cluster = None
+        if cluster_listen or cluster_peers:
+            self.cluster = Cluster(self, cluster_name or "master", cluster_listen, cluster_peers,
+                                   cluster_advertise)
+        self.init_metrics()
+        self.init_handlers()
+
+    def log(self, msg, level=INFO, category="general"):
+        self.logger.log(msg, level, category)
+
+    def init_metrics(self):
+        """Compteurs du chemin des messages ; le reste est lu à la collecte."""
+        m = self.metrics = Metrics()
+        self.frames_in = m.counter("onion_master_frames_received_total", "Trames reçues par pair et par type",
+                                   ("peer", "type"))
+        self.bytes_in = m.counter("onion_master_bytes_received_total", "Octets reçus par pair", ("peer",))
+        self.handle_time = m.histogram("onion_master_handle_seconds", "Durée d'aiguillage d'une trame", ("type",))
+        self.decompress_time = m.histogram("onion_master_decompress_seconds",
+                                           "Décompression d'un texte à la livraison finale")
+        self.compressed_bytes = m.counter("onion_master_compressed_bytes_total",
+                                          "Textes compressés livrés : octets reçus (wire) et décompressés (raw)",
+                                          ("kind",))
+        self.reaped = m.counter("onion_master_idle_disconnects_total", "Pairs muets déconnectés", ("kind",))
+        m.collected("onion_master_router_rtt_seconds", "RTT moyen des routeurs (PING/PONG)",
+                    lambda: [((name,), rtt) for name, rtt in self.registry.rtt.items()], ("router",))
+        m.collected("onion_master_router_up", "Routeur connecté ici et qui a répondu au dernier PING",
+                    lambda: [((name,), int(name not in self.registry.suspect)) for name in self.routers],
+                    ("router",))
+        self.key_rotations = m.counter("onion_master_key_rotations_total", "Clés de routeur renouvelées")
+        m.collected("onion_master_key_version", "Version du cache de clés (+1 à chaque changement)",
+                    lambda: self.registry.keys.version)
+        m.collected("onion_master_frames_sent_total", "Trames envoyées par pair",
+                    lambda: self.peer_stats("sent_frames"), ("peer",), "counter")
+        m.collected("onion_master_bytes_sent_total", "Octets envoyés par pair",
+                    lambda: self.peer_stats("sent_bytes"), ("peer",), "counter")
+        m.collected("onion_master_dropped_total", "Trames refusées (file pleine, politique drop)",
+                    lambda: self.peer_stats("dropped"), ("peer",), "counter")
+        m.collected("onion_master_queue_bytes", "Octets en file de sortie par pair",
+                    lambda: self.peer_stats("queued_bytes"), ("peer",))
+        m.collected("onion_master_clients", "Clients connectés", lambda: len(self.clients))
+        m.collected("onion_master_routers", "Routeurs connectés", lambda: len(self.routers))
+        m.collected("onion_master_circuits", "Circuits ouverts", lambda: len(self.circuits))
+        self.mailbox_wait = m.histogram("onion_master_mailbox_wait_seconds",
+                                        "Attente d'un message gardé pour un client hors ligne",
+                                        buckets=MAILBOX_BUCKETS)
+        m.collected("onion_master_mailbox_messages", "Messages en attente de clients hors ligne",
+                    lambda: len(self.mailbox))
+        m.collected("onion_master_mailbox_bytes", "Octets en attente de clients hors ligne",
+                    lambda: [(("memory",), self.mailbox.memory_bytes), (("disk",), self.mailbox.disk_bytes)],
+                    ("where",))
+        m.collected("onion_master_mailbox_oldest_seconds", "Âge du plus vieux message en attente",
+                    lambda: self.mailbox.oldest_age())
+        m.collected("onion_master_mailbox_total", "Messages gardés, livrés, périmés ou refusés (boîte pleine)",
+                    lambda: [((outcome,), getattr(self.mailbox, outcome))
+                             for outcome in ("queued", "delivered", "expired", "dropped")],
+                    ("outcome",), "counter")
+        m.collected("onion_db_queue_depth", "Lignes en attente d'écriture en base",
+                    lambda: self.store.queue_depth() if self.store else 0)
+
+    def peer_stats(self, field):
+        peers = list(self.clients.items()) + list(self.routers.items())
+        return [((name,), getattr(out, field)) for name, out in peers]
+
+    def db_connect(self):
+        import mariadb
+        return mariadb.connect(
+            host="localhost",
+            port=3306,
+            user="onionadmin",
+            password="adminonion",
+            database="onion"
+        )
+
+    def init_db(self):
+        """Pool de connexions + file d'écriture différée, ou None sans MariaDB."""
+        try:
+            self.db_connect().close()
+            self.log("✅ Connexion MariaDB OK")
+        except Exception as e:
+            self.log(f"❌ Erreur MariaDB: {e}", ERROR)
+            return None
+        self.db = ConnectionPool(self.db_connect, size=DB_POOL_SIZE)
+        self.store = WriteBehindStore(self.db, log=self.log).start()
+        self.metrics.add(self.store.flush_seconds)
+        return self.db
+
+    def save_entity_to_db(self, name, ip="0.0.0.0", port=0):
+        """Met en file la sauvegarde d'un routeur ou client (ne bloque pas)"""
+        if not self.store:
+            return
+
+        if name.startswith("Client"):
+            self.store.upsert_client(name, ip)
+        elif is_router_name(name):
+            # Sauvegarde routeur avec sa clé courante
+            key = self.registry.keys.get(name)
+            if key:
+                self.store.upsert_router(name, ip, port, str(key[1]))
+
+    def fetch_keys(self):
+        """Toutes les clés routeurs connues, en une requête ; celles des nouveaux
+        routeurs sont créées à leur HELLO (registre dynamique, pas de liste figée).
+        Appelé une seule fois, au premier HELLO de routeur (KeyCache.load)."""
+        if not self.db:
+            self.log("⚠️ MariaDB non dispo, clés créées à la connexion des routeurs (non persistées)", WARNING)
+            return []
+
+        try:
+            with self.db.connection() as db:
+                cur = db.cursor()
+                cur.execute("SELECT name, key_value FROM routers")
+                rows = [(name, key) for name, key in cur.fetchall() if is_router_name(name)]
+            self.log(f" {len(rows)} clés chargées depuis MariaDB")
+            return rows
+        except Exception as e:
+            self.log(f"❌ Erreur chargement clés MariaDB: {e}", ERROR)
+            return []
+
+    def update_counts(self):
+        self.observer.counts_changed(len(self.clients), len(self.routers))
+
+    def run(self, port=9000, host="0.0.0.0", reuse_port=False):
+        """Point d'entrée bloquant : démarre la boucle et sert jusqu'à stop()."""
+        asyncio.run(self.serve(port, host, reuse_port))
+
+    async def serve(self, port=9000, host="0.0.0.0", reuse_port=False):
+        self.loop = asyncio.get_running_loop()
+        # Connexion de test et chargement des clés : bloquant, hors de la boucle
+        await self.loop.run_in_executor(None, self.init_db)
+        if self.db:
+            self.log("✅ MariaDB connecté")
+        raise_fd_limit()
+        if self.metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, self.metrics_host, self.metrics_port,
+                                                    log=self.log).start()
+            except OSError as e:
+                self.log(f"⚠️ Métriques indisponibles sur le port {self.metrics_port}: {e}", WARNING)
+
+        if self.cluster:
+            await self.cluster.start()
+
+        # reuse_port : plusieurs workers acceptent sur le même port
+        self.server = await asyncio.start_server(
+            self.handle_client, host, port,
+            reuse_address=True, reuse_port=reuse_port or None, backlog=LISTEN_BACKLOG
+        )
+        self.log(f"Écoute: {host}:{port}")
+        rotation = asyncio.ensure_future(self.rotate_keys())
+        housekeeping = asyncio.ensure_future(self.expire_mailbox())
+        heartbeat = asyncio.ensure_future(self.heartbeat()) if self.heartbeat_interval else None
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            finally:
+                rotation.cancel()
+                housekeeping.cancel()
+                if heartbeat:
+                    heartbeat.cancel()
+                self.mailbox.close()
+                if self.store:
+                    self.store.stop()
+                if self.metrics_server:
+                    self.metrics_server.close()
+                if self.cluster:
+                    self.cluster.close()
+
+    def stop(self):
+        """Arrête le serveur (appelable depuis un autre thread)."""
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    async def handle_client(self, reader, writer):
+        name = None
+        out = None
+        # views : les payloads sont des memoryview sur les blocs lus, relayés sans copie
+        conn = StreamConnection(reader, writer, views=True)
+        try:
+            frames = conn.frames()
+            # Une connexion qui ne dit jamais HELLO ne garde pas sa place
+            ftype, ident = await asyncio.wait_for(frames.__anext__(), self.idle_timeout or None)
+            if ftype != framing.HELLO or not ident:
+                conn.close()
+                return
+            # Les routeurs annoncent leur port d'écoute : "R2|4002|xor,shake",
+            # les clients les compressions qu'ils savent faire : "Client_A|lz4,zlib|xor,shake",
+            # puis les suites de chiffrement qu'ils connaissent (absentes : XOR seulement)
+            name, _, extra = bytes(ident).decode('utf-8').partition("|")
+            extra, _, suites = extra.partition("|")
+            listen_port, codec = "", None
+            if name.startswith("Client"):
+                codec = compress.negotiate(extra.split(",")) if extra else None
+            else:
+                listen_port = extra
+            if not (name.startswith("Client") or is_router_name(name)):
+                self.log(f"❌ Nom inconnu refusé: {name!r} (Client_X ou R<n>)", ERROR)
+                conn.close()
+                return
+            if self.suite.name not in (suites.split(",") if suites else [cipher.DEFAULT_SUITE]):
+                self.log(f"❌ {name} refusé: ne connaît pas la suite {self.suite.name} ({suites or 'xor'})", ERROR)
+                conn.close()
+                return
+
+            host = writer.get_extra_info("peername")[0]
+            policy = self.client_policy if name.startswith("Client") else self.router_policy
+            out = PeerSender(writer, self.high_water, self.low_water, policy,
+                             on_full=self.congested.add).start()
+            self.activity[name] = perf_counter()
+            if name.startswith("Client"):
+                self.clients[name] = out
+            else:
+                if not self.registry.keys.loaded:
+                    # Premier routeur : chargement en bloc des clés connues, hors de la boucle
+                    await self.loop.run_in_executor(None, self.registry.keys.load)
+                key, created = self.registry.issue_key(name)
+                if created:
+                    self.log(f" Clé générée pour {name}: {format_key(key)}")
+                self.registry.connected(name, out)
+                if listen_port:
+                    self.router_addrs[name] = (host, int(listen_port))
+
+            # ✅ SAUVEGARDE ROUTEUR/CLIENT EN BASE (écriture différée, par lots)
+            self.save_entity_to_db(name, host, int(listen_port or 0))
+
+            if self.cluster:
+                self.cluster.announce(name)
+            self.update_counts()
+            self.log(f"✅ {name} connecté", INFO, "connexion")
+
+            if name.startswith("Client"):
+                # Réponse au HELLO : la compression retenue part avec les clés
+                out.send(framing.KEYS, self.key_announcement() + (f"|~{codec}" if codec else ""))
+                if self.mailbox.pending(name):
+                    self.start_drain(name)
+            else:
+                out.send(framing.PRIVKEY, format_keyring(self.registry.keys.keyring(name), self.suite.name))
+                self.broadcast_peers()
+                self.broadcast_keys()
+
+            frames_in, bytes_in, handle_time = self.frames_in, self.bytes_in, self.handle_time
+            activity = self.activity
+            async for ftype, payload in frames:
+                start = activity[name] = perf_counter()
+                self.handle_message(name, ftype, payload)
+                kind = framing.TYPE_NAMES.get(ftype, "?")
+                handle_time.observe(perf_counter() - start, (kind,))
+                frames_in.inc((name, kind))
+                bytes_in.inc((name,), len(payload))
+                if self.congested:
+                    # Contre-pression : on ne lit plus cet émetteur tant qu'une
+                    # destination qu'il alimente est au-dessus de son seuil haut
+                    full = list(self.congested)
+                    self.congested.clear()
+                    await asyncio.gather(*(peer.wait_writable() for peer in full))
+        except (StopAsyncIteration, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            if name:
+                self.log(f"❌ {name}: {e}", ERROR)
+        finally:
+            if out:
+                out.close()
+            conn.close()
+            self.cleanup(name, out)
+
+    def broadcast_peers(self):
+        """Envoie l'annuaire des routeurs à tous les routeurs connectés."""
+        peers = format_peers(self.router_addrs)
+        for conn in self.routers.values():
+            conn.send(framing.PEERS, peers)
+
+    def local_names(self):
+        return list(self.clients) + list(self.routers)
+
+    def ownership(self, name):
+        """Payload OWN : le nom, et pour un routeur sa clé et son adresse de liens directs."""
+        if name not in self.routers:
+            return name
+        host, port = self.router_addrs.get(name, ("", ""))
+        return f"{name}|{format_key(self.registry.keys[name])}|{host}:{port}"
+
+    def remote_joined(self, name, info, owner):
+        """OWN reçu d'un autre Master (nouveau routeur, ou nouvelle clé après rotation)."""
+        if not is_router_name(name):
+            out = self.clients.get(name)
+            if out is not None:
+                # Le client s'est reconnecté sur un autre worker : l'ancienne session
+                # d'ici est morte, sinon deliver() lui remettrait encore ses messages
+                self.log(f"♻️ {name} repris par un autre Master, ancienne session fermée", INFO, "connexion")
+                for circ in list(self.client_circuits.pop(name, ())):
+                    self.drop_circuit(circ)
+                del self.clients[name]  # cleanup() de sa connexion fera le reste
+                out.close()
+                out.writer.transport.abort()
+            if self.mailbox.pending(name):
+                self.forward_mailbox(name)
+            return
+        _, key, addr = info.split("|")
+        known = self.registry.remote.get(name) == owner
+        if self.registry.remote_connected(name, owner, parse_key(key)) and known:
+            self.push_keys([name])
+        if known:
+            return
+        host, _, port = addr.rpartition(":")
+        if port:
+            self.router_addrs[name] = (host, int(port))
+        self.broadcast_peers()
+        self.broadcast_keys()
+
+    def remote_left(self, name, owner):
+        if self.registry.remote_disconnected(name, owner):
+            if name not in self.routers:
+                self.router_addrs.pop(name, None)
+                self.forget_entry_circuits(name)
+            self.broadcast_peers()
+            self.broadcast_keys()
+
+    def deliver_local(self, name, ftype, payload):
+        """Trame pour un pair connecté ici. False s'il n'y est pas (ou plus) ; une file
+        pleine n'en fait pas un inconnu, send_to() la signale comme congestion."""
+        peer = self.clients.get(name) or self.routers.get(name)
+        if peer is None or peer.closed:
+            return False
+        self.send_to(name, peer, ftype, payload)
+        return True
+
+    def deliver(self, name, ftype, payload):
+        """Trame pour le pair name, servi ici ou par un autre Master. False s'il est inconnu."""
+        if self.deliver_local(name, ftype, payload):
+            return True
+        return self.cluster is not None and self.cluster.relay(name, ftype, payload)
+
+    def forward(self, router, ftype, payload):
+        """Trame d'onion ou de circuit pour un saut : jamais remise à un client,
+        même si le chemin en nomme un. False si le routeur est inconnu."""
+        return is_router_name(router) and self.deliver(router, ftype, payload)
+
+    def deliver_or_store(self, name, ftype, payload, relay=True):
+        """Livraison finale : un client hors ligne, dont la file est pleine, ou qui a
+        encore du courrier en attente (pour garder l'ordre) la retrouvera dans sa
+        boîte. relay=False : sans passer par un autre Master. False si perdue."""
+        if not self.mailbox.pending(name):
+            out = self.clients.get(name)
+            if out is not None and not out.closed:
+                # File pleine : drain_mailbox() le livrera quand elle se sera vidée
+                if out.send(ftype, payload):
+                    return True
+            elif self.deliver(name, ftype, payload) if relay else self.deliver_local(name, ftype, payload):
+                return True
+        return self.hold(name, ftype, payload)
+
+    def hold(self, name, ftype, payload):
+        """Met la trame dans la boîte de name et relance sa livraison. False si perdue."""
+        if not name.startswith("Client"):
+            return False
+        if not self.mailbox.pending(name) and name not in self.clients:
+            self.log(f"📪 {name} hors ligne : messages gardés jusqu'à son retour", INFO, "mailbox")
+        if not self.mailbox.put(name, ftype, payload):
+            self.log(f"❌ Boîte de {name} pleine, message perdu", ERROR, "mailbox")
+            return False
+        if name in self.clients:
+            self.start_drain(name)
+        elif self.cluster and self.cluster.owner(name):
+            self.forward_mailbox(name)
+        return True
+
+    def start_drain(self, name):
+        if name not in self.draining:
+            self.draining.add(name)
+            asyncio.ensure_future(self.drain_mailbox(name, self.clients[name]))
+
+    async def drain_mailbox(self, name, out):
+        """Livre le courrier en attente de name par lots de la taille de sa file de sortie."""
+        count = 0
+        try:
+            while self.clients.get(name) is out and not out.closed:
+                # Chaque lot attend que le client ait lu le précédent (file sous le seuil bas)
+                await out.wait_writable()
+                if self.clients.get(name) is not out or out.closed:
+                    break
+                batch = self.mailbox.take(name, self.high_water - out.queued_bytes)
+                if not batch:
+                    break
+                for i, (age, ftype, payload) in enumerate(batch):
+                    if not out.send(ftype, payload):
+                        # File fermée (ou pleine) entre-temps : le reste repart au lot suivant
+                        self.mailbox.restore(name, batch[i:])
+                        break
+                    self.mailbox_wait.observe(age)
+                    count += 1
+        finally:
+            self.draining.discard(name)
+        if count:
+            self.log(f"📬 {count} messages en attente livrés à {name}", INFO, "mailbox")
+
+    def forward_mailbox(self, name):
+        """name s'est connecté à un autre Master : son courrier part dans des RELAY."""
+        batch = self.mailbox.take(name)
+        for age, ftype, payload in batch:
+            self.cluster.relay(name, ftype, payload)
+            self.mailbox_wait.observe(age)
+        self.log(f"📬 {len(batch)} messages en attente relayés à {name}", INFO, "mailbox")
+
+    async def expire_mailbox(self):
+        while True:
+            await asyncio.sleep(MAILBOX_TICK)
+            expired = self.mailbox.expire()
+            if expired:
+                self.log(f"📪 {expired} messages en attente périmés", WARNING, "mailbox")
+
+    def send_to(self, name, peer, ftype, payload):
+        if not peer.send(ftype, payload):
+            self.log(f"⚠️ File de {name} pleine ({peer.queued_bytes} o), trame abandonnée",
+                     WARNING, "backpressure")
+
+    def broadcast_keys(self):
+        """Annonce aux clients l'ensemble des routeurs connectés et leurs clés."""
+        keys = self.key_announcement()
+        for out in self.clients.values():
+            out.send(framing.KEYS, keys)
+
+    def key_announcement(self):
+        """KEYS : clés des routeurs, et la suite de chiffrement si ce n'est pas le XOR historique."""
+        keys = self.registry.announcement()
+        if self.suite.name == cipher.DEFAULT_SUITE:
+            return keys
+        return f"{keys}|+{self.suite.name}"
+
+    def push_keys(self, names):
+        """Mise à jour incrémentale : seulement les clés de names (REKEY), sans toucher aux circuits."""
+        updates = self.registry.key_updates(names)
+        if not updates:
+            return
+        for out in self.clients.values():
+            out.send(framing.REKEY, updates)
+
+    async def rotate_keys(self):
+        """Rotation planifiée des clés des routeurs servis ici (onion/keys.py).
+
+        Le routeur reçoit d'abord ses clés (PRIVKEY : nouvelle + ancienne en
+        recouvrement) ; les clients et les autres Masters n'apprennent la
+        nouvelle qu'ANNOUNCE_DELAY plus tard, quand le routeur la connaît.
+        """
+        keys = self.registry.keys
+        while True:
+            await asyncio.sleep(KEY_TICK)
+            version = keys.version
+            for name in keys.due(list(self.routers)):
+                keys.rotate(name)
+                self.key_rotations.inc()
+                self.routers[name].send(framing.PRIVKEY, format_keyring(keys.keyring(name), self.suite.name))
+                self.save_entity_to_db(name, *self.router_addrs.get(name, ("0.0.0.0", 0)))
+                self.log(f"🔑 Nouvelle clé pour {name} (époque {keys[name][0]})", INFO, "connexion")
+            for name in keys.expire():
+                # ancienne époque hors recouvrement : le routeur l'oublie
+                if name in self.routers:
+                    self.routers[name].send(framing.PRIVKEY, format_keyring(keys.keyring(name), self.suite.name))
+            rotated = [n for n in keys.changed_since(version) if n in self.routers]
+            if not rotated:
+                continue
+            await asyncio.sleep(ANNOUNCE_DELAY)
+            rotated = [n for n in rotated if n in self.routers]
+            self.push_keys(rotated)
+            if self.cluster:
+                for name in rotated:
+                    self.cluster.announce(name)
+
+    async def heartbeat(self):
+        """PING périodique vers chaque pair servi ici.
+
+        Le PONG des routeurs donne leur RTT et leur état (onion/registry.py) ;
+        un pair muet depuis idle_timeout est déconnecté, ce qui libère son
+        socket, sa coroutine et sa place dans clients/routers. Les clients
+        actifs depuis le battement précédent ont leur last_seen rafraîchi en
+        base, en un seul lot.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = perf_counter()
+            ping = framing.HEARTBEAT.pack(now, int(self.idle_timeout * 1000))
+            # Battement très en retard : c'est le Master qui était figé, pas ses pairs
+            reap = self.idle_timeout and now - self.last_beat < self.idle_timeout
+            active = []
+            for name, out in list(self.clients.items()) + list(self.routers.items()):
+                last = self.activity.get(name, now)
+                if reap and now - last > self.idle_timeout:
+                    self.reap(name, out, now - last)
+                    continue
+                if name in self.routers:
+                    self.registry.ping_sent(name, now)
+                elif last > self.last_beat:
+                    active.append(name)
+                out.send(framing.PING, ping)
+            self.last_beat = now
+            if self.store and active:
+                self.store.touch_clients(active)
+
+    def reap(self, name, out, idle):
+        """Pair muet (connexion à moitié ouverte) : coupure immédiate, cleanup() suit."""
+        self.log(f"💤 {name} muet depuis {idle:.0f} s, déconnecté", WARNING, "connexion")
+        self.reaped.inc(("client" if name in self.clients else "router",))
+        out.close()  # débloque aussi ceux qui attendaient sa file (politique block)
+        out.writer.transport.abort()
+
+    def init_handlers(self):
+        """Table type de trame → handler(sender, ftype, msg, trace)."""
+        self.handlers = framing.Dispatcher()
+        self.handlers.register(self.handle_onion, framing.ONION)
+        self.handlers.register(self.handle_hop, framing.HOP)
+        self.handlers.register(self.handle_circuit, framing.CREATE, framing.CELL, framing.DATA, framing.DESTROY)
+        self.handlers.register(self.handle_stream, framing.CHUNK, framing.WINDOW)
+        self.handlers.register(self.handle_pong, framing.PONG)
+
+    def handle_message(self, sender, ftype, msg):
+        """Aiguillage non bloquant : les envois partent dans le tampon du pair.
+
+        msg est en octets (souvent une memoryview sur le bloc reçu) : seul
+        l'en-tête en clair est lu, le payload chiffré est relayé tel quel,
+        sans décodage ni recopie.
+        """
+        trace = self.logger.enabled(DEBUG)
+        if trace:
+            self.log(f" {sender}: {framing.TYPE_NAMES.get(ftype, ftype)} {bytes(msg[:60])!r}", DEBUG, "trafic")
+        handler = self.handlers.get(ftype)
+        if handler is None:
+            return
+        try:
+            handler(sender, ftype, msg, trace)
+        except ValueError as e:  # nom tronqué (split_named), nom non UTF-8
+            self.log(f"❌ {framing.TYPE_NAMES.get(ftype, ftype)} mal formé ({e}): {bytes(msg[:80])!r}", ERROR)
+
+    def handle_onion(self, sender, ftype, msg, trace):
+        # "<entrée><onion>" ; entrée "*R2" = le Master choisit l'entrée,
+        # l'onion du client commence à R2
+        entry, onion = framing.split_named(msg)
+        if entry.startswith(b"*"):
+            first = self.registry.pick_entry()
+            if first is None:
+                self.log("❌ Aucun routeur connecté", ERROR)
+                return
+            # Le Master connaît les clés : il ajoute la couche du routeur d'entrée
+            if entry[1:]:
+                plain = layer.pack_layer(entry[1:].decode('utf-8'), onion, self.layer_version)
+            elif onion[:1] == layer.V2_BYTE:
+                plain = onion  # chemin "*" : couche de sortie déjà construite par le client
+            else:
+                plain = layer.pack_layer("", onion, layer.V1)  # ancien client : "TO:<dest>;MSG:<texte>"
+            onion = seal(plain, self.registry.keys[first], self.suite)
+        else:
+            first = entry.decode('utf-8')
+            if first in self.registry.recent:
+                self.registry.record(first)
+        if self.forward(first, framing.NEXT, onion):
+            if trace:
+                self.log(f" Master → {first}", DEBUG, "trafic")
+        else:
+            self.log(f"❌ Routeur {first} non connecté", ERROR)
+
+    def handle_hop(self, sender, ftype, msg, trace):
+        next_hop, payload = framing.split_named(msg)
+        if next_hop:
+            next_hop = next_hop.decode('utf-8')
+            if self.forward(next_hop, framing.NEXT, payload):
+                if trace:
+                    self.log(f" {sender} → {next_hop}", DEBUG, "trafic")
+            else:
+                self.log(f"❌ Routeur inconnu: {next_hop}", ERROR)
+            return
+
+        # Livraison finale "<dest><texte>" → FROM "<sender><texte>",
+        # le texte est repris tel quel derrière le nouvel en-tête
+        dest, text = framing.split_named(payload)
+        dest = dest.decode('utf-8')
+        if text[:1] == compress.MARKER:
+            text = self.decompress(text)
+            if text is None:
+                return
+        if self.deliver_or_store(dest, framing.FROM, (framing.name_header(sender), text)):
+            if trace:
+                self.log(f" Master → {dest}", DEBUG, "trafic")
+        else:
+            self.log(f"❌ Client inconnu: {dest}", ERROR)
+
+    def handle_pong(self, sender, ftype, msg, trace):
+        if sender in self.routers and len(msg) >= framing.HEARTBEAT.size:
+            stamp, _ = framing.HEARTBEAT.unpack_from(msg)
+            rtt = perf_counter() - stamp
+            self.registry.pong(sender, rtt)
+            if trace:
+                self.log(f" {sender} RTT {rtt * 1000:.2f} ms", DEBUG, "trafic")
+
+    def decompress(self, text):
+        """Texte compressé par le client (onion/compress.py) → texte en clair, None si illisible."""
+        start = perf_counter()
+        try:
+            plain = compress.unpack(text)
+        except ValueError as e:
+            self.log(f"❌ Décompression: {e}", ERROR)
+            return None
+        self.decompress_time.observe(perf_counter() - start)
+        self.compressed_bytes.inc(("wire",), len(text))
+        self.compressed_bytes.inc(("raw",), len(plain))
+        return plain
+
+    def handle_circuit(self, sender, ftype, msg, trace):
+        """CREATE/CELL/DATA/DESTROY venant d'un client : relais vers le routeur d'entrée."""
+        if ftype == framing.CREATE:
+            # "<entrée><id><onion de création>", entrée comme pour ONION
+            entry, rest = framing.split_named(msg)
+            if len(rest) < CIRC_ID.size:
+                self.log(f"❌ CREATE mal formé: {bytes(msg[:80])!r}", ERROR)
+                return
+            circ, onion = bytes(rest[:CIRC_ID.size]), rest[CIRC_ID.size:]
+            star = entry.startswith(b"*")
+            if star:
+                first = self.registry.pick_entry()
+                if first is None:
+                    self.log("❌ Aucun routeur connecté", ERROR)
+                    return
+                # Sans saut client, l'onion est déjà la couche de sortie "|<destination>"
+                plain = entry[1:] + b"|" + onion if entry[1:] else onion
+                onion = seal(plain, self.registry.keys[first], self.suite)
+            else:
+                first = entry.decode('utf-8')
+                if first in self.registry.recent:
+                    self.registry.record(first)
+            if not self.forward(first, framing.CREATE, (circ, onion)):
+                self.log(f"❌ Routeur {first} non connecté", ERROR)
+                return
+            self.circuits[circ] = (first, sender, star)
+            self.client_circuits.setdefault(sender, set()).add(circ)
+            if trace:
+                self.log(f"🧵 Circuit {circ.hex()} de {sender} par {first}", DEBUG, "trafic")
+            return
+
+        circ = bytes(msg[:CIRC_ID.size])
+        info = self.circuits.get(circ)
+        if info is None or info[1] != sender:
+            self.log(f"⚠️ Circuit inconnu de {sender}: {circ.hex()}", WARNING)
+            return
+        first, _, star = info
+        if ftype == framing.DESTROY:
+            self.drop_circuit(circ)
+            return
+        body = memoryview(msg)[CIRC_ID.size:]
+        if star:
+            body = seal(body, self.registry.keys[first], self.suite)
+        if not self.forward(first, ftype, (circ, body)):
+            self.log(f"❌ Routeur {first} non connecté", ERROR)
+
+    def handle_stream(self, sender, ftype, msg, trace):
+        """Flux (onion/stream.py) : CHUNK d'un routeur de sortie vers le destinataire,
+        WINDOW d'un destinataire vers l'expéditeur. Le reste est relayé sans copie."""
+        dest, rest = framing.split_named(msg)
+        dest = dest.decode('utf-8')
+        if not dest.startswith("Client") or (ftype == framing.CHUNK) != is_router_name(sender):
+            self.log(f"❌ {framing.TYPE_NAMES[ftype]} refusé de {sender} pour {dest}", ERROR)
+            return
+        if self.deliver(dest, ftype, rest):
+            if trace:
+                self.log(f" {framing.TYPE_NAMES[ftype]} {sender} → {dest}", DEBUG, "trafic")
+        else:
+            self.log(f"❌ Client inconnu: {dest}", ERROR)
+
+    def drop_circuit(self, circ):
+        """Oublie un circuit et prévient son routeur d'entrée."""
+        first, owner, _ = self.circuits.pop(circ)
+        owned = self.client_circuits.get(owner)
+        if owned:
+            owned.discard(circ)
+        self.forward(first, framing.DESTROY, circ)
+
+    def forget_entry_circuits(self, router):
+        """router est parti : ses circuits d'entrée sont morts avec son lien."""
+        for circ in [c for c, (first, _, _) in self.circuits.items() if first == router]:
+            _, owner, _ = self.circuits.pop(circ)
+            owned = self.client_circuits.get(owner)
+            if owned:
+                owned.discard(circ)
+
+    def cleanup(self, name, out):
+        if name:
+            if self.clients.get(name) is out:
+                for circ in list(self.client_circuits.pop(name, ())):
+                    self.drop_circuit(circ)
+            # Ne retire l'entrée que si elle n'a pas été remplacée par une reconnexion
+            if self.clients.get(name) is out:
+                del self.clients[name]
+            if self.registry.disconnected(name, out):
+                self.router_addrs.pop(name, None)
+                self.forget_entry_circuits(name)
+                self.broadcast_peers()
+                self.broadcast_keys()
+            if name not in self.clients and name not in self.routers:
+                self.activity.pop(name, None)
+                # Séries par pair : sans cela, une par nom de client jamais revenu
+                self.frames_in.remove((name,))
+                self.bytes_in.remove((name,))
+                # Repris par un autre Master : surtout pas de GONE pour lui
+                if self.cluster and self.cluster.owner(name) is None:
+                    self.cluster.forget(name)
+            self.update_counts()
+            self.log(f" {name} déconnecté", INFO, "connexion")
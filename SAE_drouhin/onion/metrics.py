@@ -0,0 +1,175 @@
+"""Métriques au format texte Prometheus, assez légères pour rester actives.
+
+Sur le chemin des messages, une mesure coûte un accès dict et une addition :
+pas de verrou (le GIL suffit pour des statistiques), histogrammes à seuils
+fixes (bisect), et aucun formatage tant que personne ne lit /metrics. Les
+valeurs qui existent déjà ailleurs (files de sortie, base) sont lues au
+moment de la collecte par une fonction plutôt que recopiées.
+
+    metrics = Metrics()
+    frames = metrics.counter("onion_frames_total", "Trames reçues", ("peer",))
+    frames.inc(("R1",))
+    MetricsServer(metrics, port=9100).start()   # GET http://host:9100/metrics
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Secondes : de 50 µs (déchiffrement d'une petite couche) à 2.5 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value == value and abs(value) != float("inf") else str(value)
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}  # tuple de valeurs de labels → total
+
+    def inc(self, key=(), amount=1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def remove(self, key):
+        """Oublie les séries dont les labels commencent par key (pair parti)."""
+        for labels in [k for k in self.values if k[:len(key)] == key]:
+            del self.values[labels]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in list(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}  # tuple de labels → [comptes par seuil (+Inf en dernier), somme]
+
+    def observe(self, value, key=()):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for key, (counts, total) in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), list(counts)):
+                cumulative += count
+                le = bound if isinstance(bound, str) else format_value(float(bound))
+                lines.append(f"{self.name}_bucket{format_labels(names, key + (le,))} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Collected:
+    """Valeurs lues à la collecte : collect() renvoie un nombre ou des paires (labels, valeur)."""
+
+    def __init__(self, name, help, collect, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labels = labels
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        values = self.collect()
+        if isinstance(values, (int, float)):
+            values = [((), values)]
+        for key, value in values:
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.items = []
+
+    def add(self, metric):
+        self.items.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def collected(self, name, help, collect, labels=(), kind="gauge"):
+        return self.add(Collected(name, help, collect, labels, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.items:
+            try:
+                lines.extend(metric.render())
+            except RuntimeError:
+                # dict modifié par un autre thread pendant la lecture : on saute
+                # cette métrique pour cette collecte plutôt que de verrouiller
+                continue
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Sert GET /metrics dans un thread dédié (aucune charge sans lecteur)."""
+
+    def __init__(self, metrics, host="127.0.0.1", port=9100, log=print):
+        self.metrics = metrics
+        self.log = log
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.log(f"📊 Métriques: http://{self.httpd.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,199 @@
+"""Persistance MariaDB en écriture différée (write-behind).
+
+Le chemin HELLO ne touche plus la base : il dépose un upsert dans une file
+(un dict par table, indexé par nom, donc 50 reconnexions de Client_A ne
+donnent qu'une ligne). Un thread vide la file périodiquement avec un
+executemany par table dans une seule transaction, sur une connexion prise
+dans un petit pool. last_seen des clients actifs est rafraîchi de la
+même façon, une fois par battement de cœur du Master (touch_clients).
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from onion.metrics import Histogram
+
+CLIENT_UPSERT = """
+    INSERT INTO clients(name, last_ip, last_seen)
+    VALUES (%s, %s, NOW()) ON DUPLICATE KEY
+    UPDATE
+        last_ip =
+    VALUES (last_ip), last_seen = NOW()
+"""
+
+CLIENT_SEEN = """
+    UPDATE clients
+    SET last_seen = NOW()
+    WHERE name = %s
+"""
+
+ROUTER_UPSERT = """
+    INSERT INTO routers(name, ip, port, key_value)
+    VALUES (%s, %s, %s, %s) ON DUPLICATE KEY
+    UPDATE
+        ip =
+    VALUES (ip), port =
+    VALUES (port), key_value =
+    VALUES (key_value), updated_at = NOW()
+"""
+
+
+class ConnectionPool:
+    """Petit pool de connexions MariaDB, ouvertes à la demande."""
+
+    def __init__(self, connect, size=2):
+        self.connect = connect
+        self.idle = queue.LifoQueue()
+        self.slots = threading.Semaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self.connect()
+            try:
+                yield conn
+            except Exception:
+                # Connexion dans un état inconnu : on ne la remet pas dans le pool
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                raise
+            self.idle.put(conn)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+            except Exception:
+                pass
+
+
+class WriteBehindStore:
+    def __init__(self, pool, flush_interval=0.2, log=print):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.log = log
+        self.lock = threading.Lock()
+        self.pending_clients = {}
+        self.pending_routers = {}
+        self.pending_seen = set()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = None
+        # Statistiques
+        self.flushes = 0
+        self.rows_written = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.flush_seconds = Histogram("onion_db_flush_seconds", "Durée d'un flush MariaDB (executemany + commit)")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Arrête le thread après un dernier flush."""
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        self.pool.close()
+
+    def upsert_client(self, name, ip):
+        with self.lock:
+            if name in self.pending_clients:
+                self.coalesced += 1
+            self.pending_clients[name] = (name, ip)
+
+    def upsert_router(self, name, ip, port, key):
+        with self.lock:
+            if name in self.pending_routers:
+                self.coalesced += 1
+            self.pending_routers[name] = (name, ip, port, key)
+
+    def touch_clients(self, names):
+        """Clients vus actifs depuis le dernier battement : last_seen au prochain flush."""
+        with self.lock:
+            self.pending_seen.update(names)
+
+    def queue_depth(self):
+        with self.lock:
+            return len(self.pending_clients) + len(self.pending_routers) + len(self.pending_seen)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+    def flush_loop(self):
+        delay = self.flush_interval
+        while not self.stopped:
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            # Base indisponible : on espace les tentatives (jusqu'à 5 s)
+            delay = self.flush_interval if self.flush() else min(delay * 2, 5.0)
+        self.flush()
+
+    def flush(self):
+        """Écrit tout ce qui est en file. Renvoie False si la base a refusé."""
+        with self.lock:
+            clients, self.pending_clients = self.pending_clients, {}
+            routers, self.pending_routers = self.pending_routers, {}
+            # un upsert du même client met déjà last_seen à jour
+            seen, self.pending_seen = self.pending_seen - clients.keys(), set()
+        if not clients and not routers and not seen:
+            return True
+
+        start = time.perf_counter()
+        try:
+            with self.pool.connection() as db:
+                cur = db.cursor()
+                if clients:
+                    cur.executemany(CLIENT_UPSERT, list(clients.values()))
+                if routers:
+                    cur.executemany(ROUTER_UPSERT, list(routers.values()))
+                if seen:
+                    cur.executemany(CLIENT_SEEN, [(name,) for name in seen])
+                db.commit()
+        except Exception as e:
+            self.errors += 1
+            self.log(f"❌ Erreur sauvegarde DB ({len(clients)} clients, {len(routers)} routeurs): {e}")
+            # On remet les lignes en file, sans écraser des mises à jour plus récentes
+            with self.lock:
+                for name, row in clients.items():
+                    self.pending_clients.setdefault(name, row)
+                for name, row in routers.items():
+                    self.pending_routers.setdefault(name, row)
+                self.pending_seen |= seen
+            return False
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.flush_seconds.observe(elapsed / 1000)
+        self.flushes += 1
+        self.rows_written += len(clients) + len(routers) + len(seen)
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.log(
+            f" DB: {len(clients)} clients, {len(routers)} routeurs sauvés, {len(seen)} last_seen "
+            f"en {elapsed:.1f} ms (file: {self.queue_depth()})"
+        )
+        return True
@@ -0,0 +1,126 @@
+"""Pipeline de traitement d'un routeur : lecture → déchiffrement → écriture.
+
+- lecture : les threads de réception (lien Master, liens directs) ne font
+  que déposer la trame et retournent lire ; au-delà de max_pending trames
+  en cours, ils attendent (contre-pression TCP vers l'émetteur) ;
+- déchiffrement : pool de threads, et pool de processus pour les couches
+  d'au moins process_threshold octets (bytes.translate garde le GIL, seuls
+  des processus occupent plusieurs cœurs) ;
+- écriture : un seul thread, qui applique les résultats dans l'ordre
+  d'arrivée (ordered=True) ou dès qu'ils sont prêts.
+
+Chaque étape est chronométrée (onion_router_stage_seconds{stage=...}) :
+wait (file + transfert vers le pool), reorder (attente des trames plus
+anciennes), write (table des circuits + envoi).
+"""
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+from onion import cipher
+
+MAX_PENDING = 1024
+PROCESS_THRESHOLD = 64 * 1024
+
+
+def timed_decrypt(data, key, suite=cipher.DEFAULT_SUITE):
+    """(clair, durée) ; fonction de module pour pouvoir partir dans un processus.
+
+    suite : nom de la suite (onion.cipher.SUITES), ValueError si la couche est refusée.
+    """
+    start = perf_counter()
+    plain = cipher.SUITES[suite].decrypt(data, key)
+    return plain, perf_counter() - start
+
+
+class Pipeline:
+    def __init__(self, write, workers=2, process_workers=0, process_threshold=PROCESS_THRESHOLD,
+                 ordered=True, max_pending=MAX_PENDING, metrics=None, decrypt_time=None, log=print):
+        self.write = write  # write(job, clair), appelé par le seul thread d'écriture
+        self.ordered = ordered
+        self.process_threshold = process_threshold
+        self.log = log
+        self.threads = ThreadPoolExecutor(max(1, workers), thread_name_prefix="decrypt")
+        self.process_workers = process_workers
+        self.processes = None  # créé au premier gros message
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.pending = 0
+        self.done = queue.SimpleQueue()
+        self.decrypt_time = decrypt_time
+        self.stage_time = None
+        if metrics is not None:
+            self.stage_time = metrics.histogram("onion_router_stage_seconds", "Durée par étape du pipeline",
+                                                ("stage",))
+            metrics.collected("onion_router_pipeline_pending", "Trames entre lecture et écriture",
+                              lambda: self.pending)
+        self.writer = threading.Thread(target=self.writer_loop, name="writer", daemon=True)
+        self.writer.start()
+
+    def pool_for(self, size):
+        if self.process_workers and size >= self.process_threshold:
+            if self.processes is None:
+                self.processes = ProcessPoolExecutor(self.process_workers)
+            return self.processes
+        return self.threads
+
+    def submit(self, job, data, key, suite=cipher.DEFAULT_SUITE):
+        """Étape lecture : ne fait que déposer. data None = rien à déchiffrer."""
+        self.slots.acquire()
+        with self.lock:
+            seq = self.seq
+            self.seq += 1
+            self.pending += 1
+        submitted = perf_counter()
+        if data is None:
+            future = Future()
+            future.set_result((None, 0.0))
+        else:
+            pool = self.pool_for(len(data))
+            if pool is self.processes:
+                data = bytes(data)  # une memoryview ne se transmet pas à un autre processus
+            future = pool.submit(timed_decrypt, data, key, suite)
+        future.add_done_callback(lambda f: self.done.put((seq, job, f, submitted, perf_counter())))
+
+    def writer_loop(self):
+        waiting = {}
+        expected = 0
+        while True:
+            item = self.done.get()
+            if item is None:
+                return
+            if not self.ordered:
+                self.emit(item)
+                continue
+            waiting[item[0]] = item
+            while expected in waiting:
+                self.emit(waiting.pop(expected))
+                expected += 1
+
+    def emit(self, item):
+        seq, job, future, submitted, finished = item
+        start = perf_counter()
+        try:
+            plain, elapsed = future.result()
+            if self.decrypt_time is not None and plain is not None:
+                self.decrypt_time.observe(elapsed)
+            if self.stage_time is not None:
+                self.stage_time.observe(max(0.0, finished - submitted - elapsed), ("wait",))
+                self.stage_time.observe(start - finished, ("reorder",))
+            self.write(job, plain)
+        except Exception as e:
+            self.log(f"❌ Pipeline: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+            self.slots.release()
+        if self.stage_time is not None:
+            self.stage_time.observe(perf_counter() - start, ("write",))
+
+    def close(self):
+        self.done.put(None)
+        self.threads.shutdown(wait=False)
+        if self.processes is not None:
+            self.processes.shutdown(wait=False)
@@ -0,0 +1,137 @@
+"""Liens directs routeur → routeur.
+
+Chaque routeur écoute sur un port annoncé au Master dans son HELLO
+("R2|4002"). Le Master diffuse l'annuaire des routeurs (trame PEERS) et un
+routeur transmet la couche suivante directement au routeur suivant, sur une
+connexion persistante réutilisée d'un message à l'autre.
+"""
+import socket
+import threading
+
+from onion import framing
+from onion.framing import FramedConnection
+
+
+def parse_peers(data):
+    """'R1=10.0.0.1:4001|R2=10.0.0.2:4002' → {'R1': ('10.0.0.1', 4001), ...}"""
+    peers = {}
+    for info in data.split("|"):
+        if "=" not in info:
+            continue
+        name, addr = info.split("=", 1)
+        host, port = addr.rsplit(":", 1)
+        peers[name] = (host, int(port))
+    return peers
+
+
+def format_peers(peers):
+    return "|".join(f"{name}={host}:{port}" for name, (host, port) in peers.items())
+
+
+class PeerPool:
+    """Connexions sortantes persistantes vers les autres routeurs, une par pair."""
+
+    def __init__(self, own_name, log=print, timeout=5):
+        self.own_name = own_name
+        self.log = log
+        self.timeout = timeout
+        self.addrs = {}
+        self.conns = {}
+        self.lock = threading.Lock()
+
+    def update(self, peers):
+        """Remplace l'annuaire ; ferme les liens vers les routeurs disparus ou déplacés."""
+        with self.lock:
+            for name, conn in list(self.conns.items()):
+                if peers.get(name) != self.addrs.get(name):
+                    conn.close()
+                    del self.conns[name]
+            self.addrs = dict(peers)
+
+    def knows(self, name):
+        return name in self.addrs
+
+    def _connection(self, name):
+        with self.lock:
+            conn = self.conns.get(name)
+            if conn is not None:
+                return conn
+            addr = self.addrs[name]
+        sock = socket.create_connection(addr, timeout=self.timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = FramedConnection(sock)
+        conn.send(framing.HELLO, self.own_name)
+        with self.lock:
+            # Un autre thread a pu ouvrir le lien pendant le connect()
+            existing = self.conns.setdefault(name, conn)
+        if existing is not conn:
+            conn.close()
+        return existing
+
+    def send(self, name, ftype, payload):
+        """Envoie directement au routeur name. Renvoie False si c'est impossible."""
+        for attempt in range(2):
+            try:
+                self._connection(name).send(ftype, payload)
+                return True
+            except KeyError:
+                return False
+            except OSError as e:
+                # Lien mort (routeur redémarré) : on le jette et on réessaie une fois
+                with self.lock:
+                    conn = self.conns.pop(name, None)
+                if conn is not None:
+                    conn.close()
+                if attempt:
+                    self.log(f"❌ Lien direct vers {name} impossible: {e}")
+        return False
+
+    def close(self):
+        with self.lock:
+            for conn in self.conns.values():
+                conn.close()
+            self.conns.clear()
+
+
+class PeerListener:
+    """Accepte les liens entrants des autres routeurs (un thread par lien)."""
+
+    def __init__(self, on_frame, log=print, host="0.0.0.0", port=0):
+        self.on_frame = on_frame
+        self.log = log
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        return self
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, addr = self.sock.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.handle_peer, args=(FramedConnection(sock),), daemon=True).start()
+
+    def handle_peer(self, conn):
+        peer = "?"
+        try:
+            for ftype, data in conn.frames():
+                if ftype == framing.HELLO:
+                    peer = data.decode('utf-8')
+                    self.log(f"🔗 Lien direct depuis {peer}")
+                else:
+                    self.on_frame(peer, ftype, data)
+        except OSError as e:
+            self.log(f"❌ Lien {peer}: {e}")
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,153 @@
+"""Reconnexion automatique au Master, partagée par les clients et les routeurs.
+
+Un Master redémarré ne fait plus tomber le réseau : Supervisor refait la
+connexion (nouveau HELLO, donc nouvelles clés) avec un délai qui double à
+chaque échec, tiré au hasard entre la moitié et le tout (jitter) pour que
+des centaines de pairs ne reviennent pas tous à la même milliseconde.
+
+Pendant la coupure, ce qui devait partir vers le Master attend dans un
+Outbox borné (octets et éléments), renvoyé en un seul lot dès que le lien
+est rétabli. Un envoi qui part dans le tampon TCP juste avant que la
+coupure soit détectée reste perdu : le lien n'est su mort qu'à la lecture.
+"""
+import random
+import threading
+from collections import deque
+
+BACKOFF_MIN = 0.1
+BACKOFF_MAX = 30.0
+OUTBOX_BYTES = 4 * 1024 * 1024
+OUTBOX_ITEMS = 10000
+CONNECT_TIMEOUT = 10.0  # connexion + HELLO : un Master figé ne bloque pas la reconnexion
+
+
+class Backoff:
+    """Délai exponentiel plafonné, avec jitter."""
+
+    def __init__(self, minimum=BACKOFF_MIN, maximum=BACKOFF_MAX, factor=2.0):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.factor = factor
+        self.ceiling = minimum
+
+    def next(self):
+        delay = random.uniform(self.ceiling / 2, self.ceiling)
+        self.ceiling = min(self.ceiling * self.factor, self.maximum)
+        return delay
+
+    def reset(self):
+        self.ceiling = self.minimum
+
+
+class Outbox:
+    """Envois faits pendant une coupure : file bornée, rejouée en un lot.
+
+    submit(élément, taille, send) appelle send(élément) si le lien est
+    ouvert ; sinon (ou si send lève OSError) l'élément attend. reopen(replay)
+    passe toute la file à replay, qui renvoie ceux qui doivent encore
+    attendre, puis rouvre le passage direct.
+    """
+
+    def __init__(self, max_bytes=OUTBOX_BYTES, max_items=OUTBOX_ITEMS):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.items = deque()  # (élément, taille)
+        self.queued_bytes = 0
+        self.open = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def submit(self, item, size, send):
+        """False si le lien est coupé et la file pleine (élément abandonné)."""
+        if self.open:
+            try:
+                send(item)
+                return True
+            except OSError:
+                self.open = False
+        with self.lock:
+            if self.open:  # rouvert entre-temps : la file vient d'être vidée
+                try:
+                    send(item)
+                    return True
+                except OSError:
+                    self.open = False
+            if len(self.items) >= self.max_items or self.queued_bytes + size > self.max_bytes:
+                self.dropped += 1
+                return False
+            self.items.append((item, size))
+            self.queued_bytes += size
+            return True
+
+    def reopen(self, replay):
+        """Lien rétabli : la file part en un lot. Renvoie le nombre d'éléments envoyés."""
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+            self.queued_bytes = 0
+            waiting = []
+            if items:
+                try:
+                    waiting = replay([item for item, _ in items]) or []
+                except OSError:
+                    self.items.extend(items)  # recoupé aussitôt : tout attend le lien suivant
+                    self.queued_bytes = sum(size for _, size in items)
+                    raise
+            sizes = {id(item): size for item, size in items}
+            for item in waiting:
+                self.items.append((item, sizes[id(item)]))
+                self.queued_bytes += sizes[id(item)]
+            self.open = True
+        return len(items) - len(waiting)
+
+    def close(self):
+        """Lien perdu : les envois suivants attendent la reconnexion."""
+        self.open = False
+
+
+class Supervisor:
+    """Connexion → session → reconnexion, jusqu'à stop().
+
+    connect() ouvre le lien et fait le HELLO (OSError si le Master ne répond
+    pas) ; session(lien) bloque tant que le lien vit. Toute autre exception
+    de connect() (adresse invalide...) arrête la boucle.
+    """
+
+    def __init__(self, connect, session, target, log=print, on_status=None, backoff=None):
+        self.connect = connect
+        self.session = session
+        self.target = target
+        self.log = log
+        self.on_status = on_status or (lambda text: None)
+        self.backoff = backoff or Backoff()
+        self.stopped = threading.Event()
+        self.reconnects = 0
+
+    def run(self, link=None):
+        """Bloquant. link : lien déjà ouvert par l'appelant (première session)."""
+        while not self.stopped.is_set():
+            if link is None:
+                try:
+                    link = self.connect()
+                except OSError as e:
+                    delay = self.backoff.next()
+                    self.on_status(f"Master {self.target} injoignable, nouvel essai dans {delay:.1f} s")
+                    self.log(f"🔁 Master {self.target} injoignable ({e}), nouvel essai dans {delay:.1f} s")
+                    self.stopped.wait(delay)
+                    continue
+                if self.reconnects:
+                    self.log(f"🔁 Reconnecté à {self.target}")
+                self.backoff.reset()
+            self.on_status(f"Connecté à {self.target}")
+            self.session(link)
+            link = None
+            if not self.stopped.is_set():
+                self.reconnects += 1
+                self.on_status("Déconnecté, reconnexion...")
+                self.stopped.wait(self.backoff.next())
+
+    def stop(self):
+        self.stopped.set()
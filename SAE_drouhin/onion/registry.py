@@ -0,0 +1,141 @@
+"""Registre dynamique des routeurs du Master.
+
+N'importe quel routeur qui dit HELLO:R<n> reçoit une clé (créée à la
+première connexion, puis renouvelée par époques, voir onion/keys.py). L'annonce KEYS envoyée aux clients ne
+contient que les routeurs connectés, et le Master choisit le routeur
+d'entrée parmi eux (tourniquet ou moins chargé) quand le client le lui
+laisse ("*" en tête de chemin).
+
+Avec plusieurs Masters (onion/cluster.py), les routeurs servis par un autre
+Master sont dans remote : annoncés aux clients et éligibles comme entrée,
+mais joints par un RELAY vers leur Master.
+
+Les PING du Master donnent le RTT de chaque routeur servi ici : il pèse
+dans la charge (moins chargé), et un routeur qui n'a pas répondu au
+dernier PING n'est plus choisi comme entrée tant qu'il en reste d'autres.
+"""
+import itertools
+import re
+import time
+
+from onion.keys import KeyCache, format_key
+
+ROUTER_NAME = re.compile(r"R\d+$")
+
+ROUND_ROBIN = "round_robin"
+LEAST_LOADED = "least_loaded"
+POLICIES = (ROUND_ROBIN, LEAST_LOADED)
+RTT_WEIGHT = 1000.0  # 1 ms de RTT pèse comme une entrée récente
+RTT_SMOOTHING = 0.25
+
+
+def is_router_name(name):
+    return ROUTER_NAME.match(name) is not None
+
+
+def router_index(name):
+    """'R12' → 12 (tri naturel des routeurs)."""
+    return int(name[1:])
+
+
+class RouterRegistry:
+    def __init__(self, policy=LEAST_LOADED, half_life=1.0, keys=None):
+        if policy not in POLICIES:
+            raise ValueError(f"politique inconnue: {policy}")
+        self.policy = policy
+        self.half_life = half_life
+        self.keys = keys if keys is not None else KeyCache()  # nom → clés par époque, connectés ou non
+        self.live = {}  # nom → PeerSender des routeurs connectés
+        self.remote = {}  # nom → Master qui sert ce routeur
+        self.recent = {}  # nom → (charge récente, instant de la mesure)
+        self.rtt = {}  # nom → RTT moyen (s), mesuré par les PING des routeurs servis ici
+        self.pinged = {}  # nom → instant du PING encore sans réponse
+        self.suspect = set()  # routeurs qui n'ont pas répondu au PING précédent
+        self.turn = itertools.count()
+
+    def issue_key(self, name):
+        """Renvoie ((époque, clé), créée) ; une clé existante n'est remplacée que par rotation."""
+        return self.keys.issue(name)
+
+    def connected(self, name, out):
+        self.live[name] = out
+        self.recent.setdefault(name, (0.0, time.monotonic()))
+
+    def disconnected(self, name, out):
+        if self.live.get(name) is out:
+            del self.live[name]
+            self.recent.pop(name, None)
+            self.rtt.pop(name, None)
+            self.pinged.pop(name, None)
+            self.suspect.discard(name)
+            return True
+        return False
+
+    def ping_sent(self, name, now):
+        """Nouveau PING : sans réponse au précédent, le routeur devient suspect."""
+        if name in self.pinged:
+            self.suspect.add(name)
+        self.pinged[name] = now
+
+    def pong(self, name, rtt):
+        """PONG reçu : le routeur répond, rtt entre dans sa moyenne."""
+        self.pinged.pop(name, None)
+        self.suspect.discard(name)
+        previous = self.rtt.get(name)
+        self.rtt[name] = rtt if previous is None else previous + RTT_SMOOTHING * (rtt - previous)
+
+    def remote_connected(self, name, owner, key):
+        """key = (époque, clé) annoncée par son Master ; True si elle a changé."""
+        self.remote[name] = owner
+        self.recent.setdefault(name, (0.0, time.monotonic()))
+        return self.keys.put(name, key)
+
+    def remote_disconnected(self, name, owner):
+        if self.remote.get(name) == owner:
+            del self.remote[name]
+            if name not in self.live:
+                self.recent.pop(name, None)
+            return True
+        return False
+
+    def names(self):
+        return sorted(self.live.keys() | self.remote.keys(), key=router_index)
+
+    def announcement(self):
+        """Payload KEYS : 'R1:123@0|R2:456@3' pour les seuls routeurs connectés (ici ou ailleurs)."""
+        return self.key_updates(self.names())
+
+    def key_updates(self, names):
+        """Payload REKEY : clés courantes de names, s'ils sont annoncés aux clients."""
+        return "|".join(f"{name}:{format_key(self.keys[name])}" for name in names
+                        if name in self.live or name in self.remote)
+
+    def load(self, name, now=None):
+        """Charge d'un routeur : entrées récentes (moyenne à décroissance
+        exponentielle) + octets en attente dans sa file de sortie."""
+        now = time.monotonic() if now is None else now
+        value, stamp = self.recent.get(name, (0.0, now))
+        decayed = value * 0.5 ** ((now - stamp) / self.half_life)
+        out = self.live.get(name)
+        return decayed + (out.queued_bytes / 4096 if out is not None else 0) + self.rtt.get(name, 0.0) * RTT_WEIGHT
+
+    def record(self, name):
+        """Compte une entrée attribuée à ce routeur."""
+        now = time.monotonic()
+        value, stamp = self.recent.get(name, (0.0, now))
+        self.recent[name] = (value * 0.5 ** ((now - stamp) / self.half_life) + 1, now)
+
+    def pick_entry(self):
+        """Routeur d'entrée selon la politique, None si aucun routeur connecté."""
+        names = self.names()
+        if not names:
+            return None
+        healthy = [n for n in names if n not in self.suspect]
+        names = healthy or names
+        if self.policy == ROUND_ROBIN:
+            name = names[next(self.turn) % len(names)]
+        else:
+            now = time.monotonic()
+            name = min(names, key=lambda n: self.load(n, now))
+        self.record(name)
+        return name
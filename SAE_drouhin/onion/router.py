@@ -0,0 +1,350 @@
+"""Routeur sans interface : connexion au Master, déchiffrement et relais des couches.
+
+La fenêtre Routeur_N.py et la commande `python -m onion router` n'en sont
+que des vues. Avec des workers de déchiffrement, les couches passent par
+un pipeline (onion/pipeline.py) : les threads de réception ne déchiffrent
+plus eux-mêmes.
+"""
+import socket
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+from onion import cipher, framing, layer
+from onion.circuit import CIRC_ID, CircuitTable, new_circuit_id, split_circuit
+from onion.framing import FramedConnection, parse_address
+from onion.keys import format_key, parse_keyring
+from onion.logbuf import DEBUG, ERROR, INFO, WARNING, Logger
+from onion.metrics import Metrics, MetricsServer
+from onion.pipeline import PROCESS_THRESHOLD, Pipeline, timed_decrypt
+from onion.pool import PeerListener, PeerPool, parse_peers
+from onion.reconnect import BACKOFF_MAX, CONNECT_TIMEOUT, Backoff, Outbox, Supervisor
+
+LAYER_TYPES = (framing.NEXT, framing.CREATE, framing.CELL, framing.DATA, framing.DESTROY)
+MAX_PARKED = 1000  # circuits dont des CELL attendent le CREATE (pipeline non ordonné)
+
+
+class RouterNode:
+    def __init__(self, name, master_addr, listen_port=0, logger=None, metrics_port=None, metrics_host="127.0.0.1",
+                 decrypt_workers=0, process_workers=0, process_threshold=PROCESS_THRESHOLD, ordered=True,
+                 reconnect_max=BACKOFF_MAX):
+        self.name = name
+        self.master_addr = master_addr
+        self.listen_port = listen_port
+        self.logger = logger or Logger().to_console()
+        self.sock = None
+        self.priv_key = None  # (époque, clé) courante
+        self.keyring = {}  # époque % 256 → clé : courante + anciennes en recouvrement (onion/keys.py)
+        self.suite = cipher.SUITES[cipher.DEFAULT_SUITE]  # imposée par le Master dans PRIVKEY
+        self.peers = PeerPool(name, log=self.log)
+        self.circuits = CircuitTable()
+        self.parked = OrderedDict()  # (origine, id de circuit) → [(job, clair)] arrivés avant le CREATE
+        self.parked_lock = threading.Lock()
+        self.listener = None
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_server = None
+        # Trames pour le Master (HOP, CHUNK) pendant une coupure, renvoyées en un lot
+        self.outbox = Outbox()
+        self.supervisor = Supervisor(self.connect, self.listen_loop, master_addr, log=self.log,
+                                     backoff=Backoff(maximum=reconnect_max))
+        self.init_metrics()
+        self.init_handlers()
+        # Sans workers, tout se fait dans le thread de réception : c'est le plus
+        # rapide sur un seul cœur (pas de passage de main entre threads)
+        self.pipeline = None
+        if decrypt_workers > 0 or process_workers > 0:
+            self.pipeline = Pipeline(self.write_layer, decrypt_workers, process_workers, process_threshold,
+                                     ordered, metrics=self.metrics, decrypt_time=self.decrypt_time,
+                                     log=lambda msg: self.log(msg, ERROR))
+
+    def log(self, msg, level=INFO, category="general"):
+        self.logger.log(msg, level, category)
+
+    def init_metrics(self):
+        m = self.metrics = Metrics()
+        self.frames_in = m.counter("onion_router_frames_received_total", "Trames reçues par origine et par type",
+                                   ("origin", "type"))
+        self.bytes_in = m.counter("onion_router_bytes_received_total", "Octets reçus par origine", ("origin",))
+        self.decrypt_time = m.histogram("onion_router_decrypt_seconds", "Durée de déchiffrement d'une couche")
+        self.forward_time = m.histogram("onion_router_forward_seconds",
+                                        "Réception → envoi au saut suivant (déchiffrement compris)", ("next",))
+        m.collected("onion_router_circuits", "Circuits connus", lambda: len(self.circuits))
+        m.collected("onion_router_peer_links", "Liens directs ouverts vers les autres routeurs",
+                    lambda: len(self.peers.conns))
+        m.collected("onion_router_outbox_frames", "Trames pour le Master en attente de reconnexion",
+                    lambda: len(self.outbox))
+        m.collected("onion_router_outbox_dropped_total", "Trames pour le Master perdues (coupure, file pleine)",
+                    lambda: self.outbox.dropped, kind="counter")
+        m.collected("onion_router_reconnects_total", "Reconnexions au Master",
+                    lambda: self.supervisor.reconnects, kind="counter")
+
+    def run(self):
+        """Bloquant : se connecte au Master et traite les trames jusqu'à close() ;
+        le lien perdu est rétabli (onion/reconnect.py), les liens directs restent.
+        False si le routeur s'est arrêté sur une erreur (adresse, port d'écoute...)."""
+        try:
+            parse_address(self.master_addr)
+            # Port d'écoute pour les liens directs depuis les autres routeurs
+            self.listener = PeerListener(self.handle_frame, log=self.log, port=self.listen_port).start()
+            if self.metrics_port is not None:
+                try:
+                    self.metrics_server = MetricsServer(self.metrics, self.metrics_host, self.metrics_port,
+                                                        log=self.log).start()
+                except OSError as e:
+                    self.log(f"⚠️ Métriques indisponibles sur le port {self.metrics_port}: {e}", WARNING)
+            self.supervisor.run()
+            return True
+        except Exception as e:
+            self.log(f"❌ {e}", ERROR)
+            return False
+        finally:
+            self.close()
+
+    def connect(self):
+        """Connexion + HELLO ; renvoie l'itérateur de trames après réception de la clé privée.
+
+        À chaque reconnexion : nouvelle clé, puis les trames en attente en un lot.
+        """
+        host, port = parse_address(self.master_addr)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect((host, port))
+        conn = FramedConnection(sock)
+        conn.send(framing.HELLO, f"{self.name}|{self.listener.port}|{','.join(cipher.available_suites())}")
+
+        frames = conn.frames()
+        ftype, data = next(frames, (None, b""))
+        if ftype != framing.PRIVKEY:
+            conn.close()
+            raise ConnectionError("Réponse Master inattendue")
+        sock.settimeout(None)  # ensuite, délai annoncé par les PING du Master
+        self.set_keys(data)
+        self.sock = conn
+        sent = self.outbox.reopen(conn.send_batch)
+        if sent:
+            self.log(f"📤 {sent} trames gardées pendant la coupure envoyées au Master")
+        return frames
+
+    def listen_loop(self, frames):
+        try:
+            for ftype, data in frames:
+                self.handle_frame("Master", ftype, data)
+            self.log("Socket fermée")
+        except Exception as e:
+            self.log(f"❌ Exception listen_loop: {e}", ERROR)
+        finally:
+            self.outbox.close()
+            self.sock.close()
+
+    def answer_ping(self, data):
+        """PONG immédiat (RTT mesuré par le Master) ; sans nouvelle du Master pendant
+        le délai qu'il annonce, la lecture échoue et la reconnexion prend le relais."""
+        try:
+            self.sock.send(framing.PONG, data)
+            self.sock.settimeout(framing.idle_timeout(data))
+        except OSError:
+            pass
+
+    def send_master(self, ftype, payload):
+        """Trame pour le Master ; lien coupé : attend la reconnexion. False si perdue."""
+        if self.outbox.submit((ftype, payload), len(payload), self.send_frame):
+            return True
+        self.log(f"❌ Master injoignable et file pleine : {framing.TYPE_NAMES[ftype]} perdu", ERROR)
+        return False
+
+    def send_frame(self, frame):
+        self.sock.send(*frame)
+
+    def close(self):
+        self.supervisor.stop()
+        self.peers.close()
+        if self.listener:
+            self.listener.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.pipeline:
+            self.pipeline.close()
+        if self.sock:
+            self.sock.close()
+
+    def set_keys(self, data):
+        """PRIVKEY : à la connexion, puis à chaque rotation ou fin de recouvrement."""
+        self.keyring, self.priv_key, suite = parse_keyring(data.decode())
+        if suite != self.suite.name:
+            self.suite = cipher.suite(suite)  # annoncée au HELLO : disponible ici
+        self.log(f"🔑 Privé: {format_key(self.priv_key)} (époques valides: {sorted(self.keyring)}, suite {suite})")
+
+    def init_handlers(self):
+        """Table type de trame → handler(origine, type, données)."""
+        self.handlers = framing.Dispatcher()
+        self.handlers.register(self.set_peers, framing.PEERS)
+        self.handlers.register(lambda origin, ftype, data: self.set_keys(data), framing.PRIVKEY)
+        self.handlers.register(lambda origin, ftype, data: self.answer_ping(data), framing.PING)
+        self.handlers.register(self.read_layer, *LAYER_TYPES)
+
+    def set_peers(self, origin, ftype, data):
+        peers = data.decode('utf-8')
+        self.peers.update(parse_peers(peers))
+        self.log(f"🔗 Annuaire routeurs: {peers}")
+
+    def handle_frame(self, origin, ftype, data):
+        """Trame reçue du Master ou d'un autre routeur (lien direct)."""
+        handler = self.handlers.get(ftype)
+        if handler is None:
+            self.log(f"ℹ️ Message ignoré: {repr(data)[:60]}", WARNING)
+            return
+        handler(origin, ftype, data)
+
+    def read_layer(self, origin, ftype, data):
+        """Couche chiffrée : étape lecture.
+
+        Le déchiffrement part dans le pipeline ; la table des circuits et les
+        envois ne sont touchés que par write_layer, dans l'ordre du pipeline.
+        """
+        start = perf_counter()
+        kind = framing.TYPE_NAMES[ftype]
+        self.frames_in.inc((origin, kind))
+        self.bytes_in.inc((origin,), len(data))
+
+        trace = self.logger.enabled(DEBUG)
+        if trace:
+            self.log(f"📨 Reçu de {origin}: {repr(data)[:80]}", DEBUG, "trafic")
+
+        if not self.keyring:
+            self.log(f"ℹ️ Message ignoré (pas encore de clé): {repr(data)[:60]}", WARNING)
+            return
+
+        body = data
+        if ftype != framing.NEXT:
+            if len(data) < CIRC_ID.size:
+                self.log(f"❌ {kind} trop court", ERROR)
+                return
+            # DESTROY n'a rien à déchiffrer ; CREATE/CELL/DATA : tout sauf l'identifiant
+            body = None if ftype == framing.DESTROY else memoryview(data)[CIRC_ID.size:]
+
+        key = None
+        if body is not None:
+            # Chaque couche commence par l'époque de la clé qui l'a chiffrée
+            epoch = body[0] if len(body) else None
+            key = self.keyring.get(epoch)
+            if key is None:
+                self.log(f"⚠️ {kind} chiffré avec une clé périmée ou inconnue (époque {epoch}), ignoré", WARNING)
+                return
+            body = memoryview(body)[1:]
+
+        job = (origin, ftype, data, start, trace)
+        if self.pipeline:
+            self.pipeline.submit(job, body, key, self.suite.name)
+            return
+        plain = None
+        if body is not None:
+            try:
+                plain, elapsed = timed_decrypt(body, key, self.suite.name)
+            except ValueError as e:
+                self.log(f"⚠️ {kind} illisible: {e}", WARNING)
+                return
+            self.decrypt_time.observe(elapsed)
+        self.write_layer(job, plain)
+
+    def write_layer(self, job, plain):
+        """Étape écriture : couche déchiffrée → table des circuits et envoi."""
+        origin, ftype, data, start, trace = job
+        try:
+            if ftype == framing.NEXT:
+                self.forward_next(plain, start, trace)
+            else:
+                self.forward_circuit(origin, ftype, data, plain, start, trace)
+        except ValueError as e:
+            self.log(f"❌ {framing.TYPE_NAMES[ftype]}: {e}", ERROR)
+
+    def forward_next(self, decrypted, start, trace):
+        if trace:
+            self.log(f"🔓 Déchiffré: {repr(decrypted)[:120]}", DEBUG, "trafic")
+
+        # En-tête de taille fixe (onion/layer.py) : le corps n'est ni parcouru ni recopié
+        next_hop, payload = layer.unpack_layer(decrypted)  # next_hop = "R2" ou ""
+
+        # encore un routeur dans la chaîne : envoi direct, sans repasser par le Master
+        if next_hop and self.peers.send(next_hop, framing.NEXT, payload):
+            self.forward_time.observe(perf_counter() - start, (next_hop,))
+            if trace:
+                self.log(f"✅ NEXT envoyé directement à {next_hop}", DEBUG, "trafic")
+            return
+
+        if next_hop:
+            # routeur sans lien direct connu → relais par le Master
+            hop_msg = framing.name_header(next_hop) + payload
+        else:
+            # plus de routeur → payload "<nom: Client_X><texte>", livraison finale par le Master
+            hop_msg = framing.FINAL + payload
+
+        if self.send_master(framing.HOP, hop_msg):
+            self.forward_time.observe(perf_counter() - start, ("Master",))
+            if trace:
+                self.log(f"✅ HOP envoyé au Master ({hop_msg[:80]})", DEBUG, "trafic")
+
+    def forward_circuit(self, origin, ftype, data, plain, start, trace):
+        circ_id, _ = split_circuit(data)
+        # Un id n'est unique que sur un lien : un chemin peut repasser par ce
+        # routeur ("*,R2" dont le Master choisit R2 comme entrée, "R1,R1"), chaque
+        # passage a donc son propre id, tiré ici pour le lien vers le saut suivant
+        key = (origin, circ_id)
+
+        if ftype == framing.CREATE:
+            next_hop, sep, inner = plain.partition(b"|")
+            if not sep:
+                raise ValueError("couche de création mal formée")
+            if next_hop:
+                next_hop = next_hop.decode('utf-8')
+                out = CIRC_ID.pack(new_circuit_id())
+                self.circuits.put(key, next_hop, out)
+                self.forward(next_hop, framing.CREATE, out + inner)
+            else:
+                # dernier routeur : l'en-tête de la destination est préparé une fois pour toutes
+                self.circuits.put(key, None, framing.name_header(inner))
+            if trace:
+                self.log(f"🧵 Circuit {circ_id:016x} → {next_hop or inner}", DEBUG, "trafic")
+            with self.parked_lock:
+                early = self.parked.pop(key, ())
+            for job, body in early:
+                self.write_layer(job, body)
+            return
+
+        if ftype == framing.DESTROY:
+            entry = self.circuits.pop(key)
+            if entry and entry[0]:
+                self.forward(entry[0], framing.DESTROY, entry[1])
+            return
+
+        entry = self.circuits.get(key)
+        if entry is None:
+            self.park(key, (origin, ftype, data, start, trace), plain)
+            return
+        next_hop, dest = entry  # dest : id sur le lien suivant, ou en-tête de la destination à la sortie
+        if next_hop:
+            self.forward(next_hop, ftype, dest + plain)
+        elif ftype == framing.DATA:
+            # sortie du circuit, morceau de flux : remis tel quel au destinataire
+            self.send_master(framing.CHUNK, dest + plain)
+        else:
+            # sortie du circuit : livraison finale par le Master
+            self.send_master(framing.HOP, framing.FINAL + dest + plain)
+        self.forward_time.observe(perf_counter() - start, (next_hop or "Master",))
+        if trace:
+            self.log(f"✅ {framing.TYPE_NAMES[ftype]} {circ_id:016x} → {next_hop or 'Master'}", DEBUG, "trafic")
+
+    def park(self, key, job, plain):
+        """CELL/DATA arrivée avant son CREATE (pipeline non ordonné) : attend le CREATE."""
+        with self.parked_lock:
+            self.parked.setdefault(key, []).append((job, plain))
+            if len(self.parked) <= MAX_PARKED:
+                return
+            (origin, lost), cells = self.parked.popitem(last=False)
+        self.log(f"⚠️ Circuit inconnu: {lost:016x} de {origin} ({len(cells)} CELL perdues)", WARNING)
+
+    def forward(self, next_hop, ftype, payload):
+        """Trame de circuit vers le routeur suivant : uniquement par lien direct."""
+        if not self.peers.send(next_hop, ftype, payload):
+            self.log(f"❌ Pas de lien direct vers {next_hop} pour le circuit", ERROR)
@@ -0,0 +1,130 @@
+"""Files de sortie bornées, une par pair du Master.
+
+Chaque pair enregistré a sa propre file et sa propre tâche d'écriture : un
+client ou un routeur lent ne fait grossir que sa file, jamais celle des
+autres. Au-delà du seuil haut, deux politiques :
+
+- "drop"  : la trame est refusée (comptée dans dropped) ;
+- "block" : la trame est acceptée mais l'émetteur est signalé (on_full) ;
+  le Master arrête alors de lire cet émetteur jusqu'à ce que la file
+  redescende sous le seuil bas (contre-pression TCP vers l'émetteur).
+
+Les trames restent en morceaux (en-tête + payload d'origine, souvent une
+memoryview sur le bloc reçu) jusqu'au writelines() : un payload relayé
+n'est jamais recopié dans le Master avant l'écriture.
+"""
+import asyncio
+from collections import deque
+
+from onion.framing import frame_buffers
+
+DROP = "drop"
+BLOCK = "block"
+POLICIES = (DROP, BLOCK)
+
+HIGH_WATER = 1024 * 1024
+LOW_WATER = 256 * 1024
+MAX_BATCH = 64
+
+
+class PeerSender:
+    def __init__(self, writer, high_water=HIGH_WATER, low_water=LOW_WATER, policy=BLOCK, on_full=None):
+        if policy not in POLICIES:
+            raise ValueError(f"politique inconnue: {policy}")
+        self.writer = writer
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.policy = policy
+        self.on_full = on_full
+        self.queue = deque()  # (taille, [en-tête, morceaux...]) par trame
+        self.queued_bytes = 0
+        self.ready = asyncio.Event()
+        self.below_low = asyncio.Event()
+        self.below_low.set()
+        self.closed = False
+        self.task = None
+        # Statistiques
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+        return self
+
+    def send(self, ftype, payload=b""):
+        """Met la trame en file sans jamais bloquer. False si elle est refusée.
+
+        payload : str, bytes, memoryview ou liste de morceaux (voir frame_buffers).
+        """
+        if self.closed:
+            return False
+        size, parts = frame_buffers(ftype, payload)
+        if self.queued_bytes >= self.high_water:
+            if self.policy == DROP:
+                self.dropped += 1
+                self.dropped_bytes += size
+                return False
+            self.below_low.clear()
+            if self.on_full:
+                self.on_full(self)
+        self.queue.append((size, parts))
+        self.queued_bytes += size
+        self.ready.set()
+        return True
+
+    async def wait_writable(self):
+        """Attend que la file soit redescendue sous le seuil bas (politique block)."""
+        while self.queued_bytes > self.low_water and not self.closed:
+            self.below_low.clear()
+            await self.below_low.wait()
+
+    async def run(self):
+        """Tâche d'écriture : vide la file par lots et respecte drain()."""
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue:
+                    batch = []
+                    size = 0
+                    frames = 0
+                    while self.queue and frames < MAX_BATCH:
+                        frame_size, parts = self.queue.popleft()
+                        batch.extend(parts)
+                        size += frame_size
+                        frames += 1
+                    # writelines : sendmsg (scatter/gather) sur les Python récents
+                    self.writer.writelines(batch)
+                    await self.writer.drain()
+                    self.queued_bytes -= size
+                    self.sent_frames += frames
+                    self.sent_bytes += size
+                    if self.queued_bytes <= self.low_water:
+                        self.below_low.set()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.below_low.set()  # débloque les émetteurs en attente
+        self.ready.set()
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def stats(self):
+        return {
+            "queued_frames": len(self.queue),
+            "queued_bytes": self.queued_bytes,
+            "sent_frames": self.sent_frames,
+            "sent_bytes": self.sent_bytes,
+            "dropped": self.dropped,
+            "dropped_bytes": self.dropped_bytes,
+        }
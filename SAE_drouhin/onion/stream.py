@@ -0,0 +1,155 @@
+"""Flux (fichiers, gros blobs) découpés en morceaux sur un circuit.
+
+Chaque morceau est une CELL de flux (trame DATA) : corps chiffré une fois
+par routeur, comme un message, mais avec un en-tête en clair pour le
+destinataire :
+
+    <id flux 4 o><n° 4 o><drapeaux 1 o><données>
+
+Le morceau 0 (OPEN) porte "expéditeur|nom|taille" ; le dernier porte FIN.
+Le routeur de sortie remet le morceau au Master (CHUNK "<nom: dest><morceau>",
+nom préfixé de sa longueur, voir framing.name_header), qui transmet
+<morceau> seul au client destinataire.
+
+Contrôle de flux : l'émetteur n'a jamais plus de WINDOW morceaux en vol
+sur un flux. Le destinataire rend du crédit (trame WINDOW, relayée par le
+Master vers l'expéditeur) au fur et à mesure qu'il écrit les morceaux sur
+disque. Les files du Master et des routeurs ne portent donc jamais plus
+d'une fenêtre par flux, et le destinataire n'a jamais en mémoire que les
+morceaux arrivés en désordre (au plus une fenêtre).
+"""
+import os
+import random
+import struct
+import threading
+
+CHUNK_HEADER = struct.Struct("!IIB")
+CREDIT = struct.Struct("!II")  # id flux, crédit
+CHUNK_SIZE = 32 * 1024
+WINDOW = 16
+CREDIT_TIMEOUT = 30.0
+MAX_ORPHANS = 64  # flux dont des morceaux attendent le morceau OPEN
+
+OPEN = 1
+FIN = 2
+
+
+def new_stream_id():
+    return random.getrandbits(32)
+
+
+def encode_chunk(stream_id, seq, flags, data=b""):
+    return CHUNK_HEADER.pack(stream_id, seq, flags) + data
+
+
+def decode_chunk(chunk):
+    """morceau → (id flux, n°, drapeaux, données en memoryview)."""
+    if len(chunk) < CHUNK_HEADER.size:
+        raise ValueError("morceau trop court")
+    stream_id, seq, flags = CHUNK_HEADER.unpack_from(chunk)
+    return stream_id, seq, flags, memoryview(chunk)[CHUNK_HEADER.size:]
+
+
+def safe_filename(name):
+    """Nom de fichier annoncé par l'expéditeur → nom local sans chemin."""
+    name = os.path.basename(name.replace("\\", "/")).strip()
+    return name if name not in ("", ".", "..") else "fichier"
+
+
+class OutgoingStream:
+    """Côté émetteur : crédit restant sur un flux."""
+
+    def __init__(self, stream_id, window=WINDOW):
+        self.stream_id = stream_id
+        self.credit = threading.Semaphore(window)
+
+    def acquire(self, timeout=CREDIT_TIMEOUT):
+        if not self.credit.acquire(timeout=timeout):
+            raise TimeoutError(f"flux {self.stream_id:08x} : pas de crédit du destinataire")
+
+    def grant(self, count):
+        for _ in range(count):
+            self.credit.release()
+
+
+class IncomingStream:
+    def __init__(self, stream_id, sender, name, size, path):
+        self.stream_id = stream_id
+        self.sender = sender
+        self.name = name
+        self.size = size
+        self.path = path
+        self.file = open(path, "wb")
+        self.next_seq = 1
+        self.early = {}  # n° → (drapeaux, données) arrivés avant leur tour
+        self.received = 0
+        self.consumed = 1  # morceaux écrits pas encore rendus en crédit (OPEN compris)
+
+
+class StreamAssembler:
+    """Côté destinataire : réassemble les flux directement dans des fichiers.
+
+    send_credit(expéditeur, id flux, crédit) rend du crédit à l'émetteur ;
+    on_done(flux) est appelé quand le morceau FIN a été écrit.
+    """
+
+    def __init__(self, directory, send_credit, on_done, window=WINDOW):
+        self.directory = directory
+        self.send_credit = send_credit
+        self.on_done = on_done
+        self.window = window
+        self.streams = {}
+        self.orphans = {}  # id flux → {n°: (drapeaux, données)} arrivés avant OPEN
+
+    def feed(self, chunk):
+        stream_id, seq, flags, data = decode_chunk(chunk)
+        if flags & OPEN:
+            stream = self.open(stream_id, bytes(data).decode('utf-8'))
+            stream.early.update(self.orphans.pop(stream_id, {}))
+        else:
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                # hors d'ordre (routeurs en pipeline non ordonné) : attend OPEN
+                self.orphans.setdefault(stream_id, {})[seq] = (flags, bytes(data))
+                if len(self.orphans) > MAX_ORPHANS:
+                    self.orphans.pop(next(iter(self.orphans)))
+                return
+            if seq != stream.next_seq:
+                # au plus une fenêtre en attente
+                stream.early[seq] = (flags, bytes(data))
+                return
+            self.write(stream, flags, data)
+        while stream.next_seq in stream.early and stream_id in self.streams:
+            self.write(stream, *stream.early.pop(stream.next_seq))
+
+    def open(self, stream_id, meta):
+        sender, name, size = meta.split("|", 2)
+        os.makedirs(self.directory, exist_ok=True)
+        base, ext = os.path.splitext(safe_filename(name))
+        path = os.path.join(self.directory, base + ext)
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{base} ({n}){ext}")
+            n += 1
+        stream = self.streams[stream_id] = IncomingStream(stream_id, sender, name, int(size), path)
+        return stream
+
+    def write(self, stream, flags, data):
+        stream.file.write(data)
+        stream.received += len(data)
+        stream.next_seq += 1
+        stream.consumed += 1
+        if flags & FIN:
+            stream.file.close()
+            del self.streams[stream.stream_id]
+            self.on_done(stream)
+            return
+        if stream.consumed >= self.window // 2:
+            self.send_credit(stream.sender, stream.stream_id, stream.consumed)
+            stream.consumed = 0
+
+    def close(self):
+        for stream in self.streams.values():
+            stream.file.close()
+        self.streams.clear()
+        self.orphans.clear()